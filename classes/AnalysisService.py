@@ -0,0 +1,356 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import facebook
+import requests
+import spacy
+
+from classes.Gazetteer import Gazetteer
+from classes.RequestScheduler import RequestScheduler
+from classes.ResultCache import ResultCache
+from classes.TextPreprocessor import TextPreprocessor
+from classes.WordCloudPlotter import Plotter
+from utils import (
+    get_logger, get_post_data, get_page_post_ids, get_comments, extract_entities,
+    save_barplot, GRAPH_URL
+)
+
+ANALYSES = ["words", "entities"]
+NER_MODES = ["spacy", "gazetteer", "prefilter"]
+LANGUAGES = ["it", "en"]
+# pyplot keeps global state, plots are made one at a time
+PLOT_LOCK = threading.Lock()
+
+logger = get_logger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def positive_int(params, name, default):
+    """
+    Return a parameter as a positive int
+
+    :param params: dict
+    :param name: str
+    :param default: int: value if the parameter is missing
+    :return: int
+    :raise ValueError: if the parameter is not a positive number
+    """
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        value = 0
+    if value < 1:
+        raise ValueError("{} must be a positive number".format(name))
+    return value
+
+
+class AnalysisService(object):
+    def __init__(self, conf, n_workers=2, cache=None, max_jobs=1000,
+                 graph_url=GRAPH_URL):
+        """
+        Run word count and NER jobs on posts or pages in a pool of
+        worker threads. The spaCy models and the gazetteer are loaded
+        once and kept in memory, and the counts of every post are
+        cached by post ID and parameters, so that a page analysis only
+        processes the posts that are not in the cache yet
+
+        :param conf: dict: configuration, as loaded from settings.conf
+        :param n_workers: int: number of jobs run at the same time
+        :param cache: classes.ResultCache.ResultCache, optional
+        :param max_jobs: int: number of finished jobs kept, oldest are dropped
+        :param graph_url: str, optional: Graph API root url,
+            e.g. of a mock server
+        """
+        self.conf = conf
+        self.cache = cache if cache is not None else ResultCache()
+        self.max_jobs = max_jobs
+        self.graph_url = graph_url
+        self.executor = ThreadPoolExecutor(max_workers=n_workers)
+        self.models = {}
+        self.gazetteer = None
+        self.models_lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.jobs_lock = threading.Lock()
+        self.scheduler = RequestScheduler.from_conf(conf)
+
+    def load_model(self, lang):
+        """
+        Return the spaCy model of a language, loading it the first time
+
+        :param lang: str: one of LANGUAGES
+        :return: spaCy model
+        """
+        with self.models_lock:
+            if lang not in self.models:
+                local_start = time.time()
+                self.models[lang] = spacy.load(self.conf[lang])
+                logger.info("Loaded spaCy model {} in {} seconds".format(
+                    self.conf[lang], round((time.time() - local_start), 1)))
+            return self.models[lang]
+
+    def load_gazetteer(self):
+        """
+        Return the gazetteer, loading it the first time
+
+        :return: classes.Gazetteer.Gazetteer
+        """
+        with self.models_lock:
+            if self.gazetteer is None:
+                self.gazetteer = Gazetteer.from_json(self.conf["gazetteer_path"])
+                logger.info("Loaded gazetteer with {} aliases".format(
+                    self.gazetteer.n_aliases))
+            return self.gazetteer
+
+    def parse_params(self, params):
+        """
+        Validate the parameters of a job and fill in the defaults
+
+        :param params: dict: post_id or page_id, and optionally
+            analysis, ner_mode, lang, n_posts and top
+        :return: dict
+        :raise ValueError: on invalid parameters
+        """
+        if not isinstance(params, dict):
+            raise ValueError("Job parameters must be a json object")
+        analysis = params.get("analysis", "words")
+        if analysis not in ANALYSES:
+            raise ValueError("analysis must be one of {}".format(ANALYSES))
+        if bool(params.get("post_id")) == bool(params.get("page_id")):
+            raise ValueError("Either post_id or page_id is required")
+        if not isinstance(params.get("post_id") or params.get("page_id"), str):
+            raise ValueError("post_id and page_id must be strings")
+        job_params = {
+            "analysis": analysis,
+            "post_id": params.get("post_id"),
+            "page_id": params.get("page_id"),
+            "n_posts": None,
+            "ner_mode": None,
+            "lang": None
+        }
+        if job_params["page_id"]:
+            job_params["n_posts"] = positive_int(params, "n_posts", 10)
+        if analysis == "entities":
+            job_params["ner_mode"] = params.get("ner_mode", "spacy")
+            if job_params["ner_mode"] not in NER_MODES:
+                raise ValueError("ner_mode must be one of {}".format(NER_MODES))
+            if job_params["ner_mode"] != "gazetteer":
+                job_params["lang"] = params.get("lang")
+                if job_params["lang"] not in LANGUAGES:
+                    raise ValueError("lang must be one of {} with ner_mode {}".format(
+                        LANGUAGES, job_params["ner_mode"]))
+            default_top = self.conf["n_top_entities"]
+        else:
+            default_top = self.conf["n_top_words"]
+        job_params["top"] = positive_int(params, "top", default_top)
+        return job_params
+
+    def submit(self, params):
+        """
+        Queue a job
+
+        :param params: dict: see parse_params
+        :return: str: job ID
+        :raise ValueError: on invalid parameters
+        """
+        job_params = self.parse_params(params)
+        job_id = uuid.uuid4().hex
+        with self.jobs_lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "params": job_params,
+                "submitted": time.time(),
+                "finished": None,
+                "error": None,
+                "result": None,
+                "plots": {}
+            }
+            finished = [
+                key for key, job in self.jobs.items() if job["status"] in ["done", "failed"]
+            ]
+            for key in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[key]
+        self.executor.submit(self.run_job, job_id)
+        return job_id
+
+    def get_job(self, job_id):
+        """
+        Return the status, parameters and, when done,
+        the result of a job, without its plots
+
+        :param job_id: str
+        :return: dict or None if the job is unknown
+        """
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        job["plots"] = sorted(job["plots"])
+        return job
+
+    def get_plot(self, job_id, name):
+        """
+        Return a plot of a finished job as PNG bytes
+
+        :param job_id: str
+        :param name: str: barplot or wordcloud
+        :return: bytes or None if there is no such plot
+        """
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return job["plots"].get(name)
+
+    def count_post(self, access_token, post_id, params):
+        """
+        Return the counts of a post, from the cache if possible
+
+        :param access_token: str
+        :param post_id: str
+        :param params: dict: job parameters
+        :return: dict: comments -> int, counts -> Counter,
+            unstemmed -> Counter (word count only)
+        """
+        key = (post_id, params["analysis"], params["ner_mode"], params["lang"])
+        post_counts = self.cache.get(key)
+        if post_counts is not None:
+            return post_counts
+        post_data = get_post_data(
+            access_token, post_id, raise_on_error=True, scheduler=self.scheduler,
+            base_url=self.graph_url)
+        comments = get_comments(post_data)
+        counts = Counter()
+        unstemmed = Counter()
+        if params["analysis"] == "words":
+            for comment in comments:
+                counts.update(TextPreprocessor(comment).preprocess().split())
+                unstemmed.update(TextPreprocessor(comment).base_preprocess().split())
+        else:
+            nlp = None
+            gazetteer = None
+            if params["ner_mode"] != "gazetteer":
+                nlp = self.load_model(params["lang"])
+            if params["ner_mode"] != "spacy":
+                gazetteer = self.load_gazetteer()
+            for comment in comments:
+                counts.update(extract_entities(comment, nlp, gazetteer))
+        post_counts = {"comments": len(comments), "counts": counts, "unstemmed": unstemmed}
+        self.cache.put(key, post_counts)
+        return post_counts
+
+    def make_plots(self, params, counts, unstemmed):
+        """
+        Return the bar plot and, for word counts, the word cloud as PNG bytes
+
+        :param params: dict: job parameters
+        :param counts: Counter
+        :param unstemmed: Counter
+        :return: dict: name -> bytes
+        """
+        plots = {}
+        if not counts:
+            return plots
+        if params["analysis"] == "words":
+            plot_labels = ["Words", "Counts"]
+            type_ = "Words"
+        else:
+            plot_labels = ["Entities", "Counts"]
+            type_ = "entities"
+        tmp_dir = tempfile.mkdtemp()
+        barplot_filepath = os.path.join(tmp_dir, "barplot.png")
+        wc_plot_filepath = os.path.join(tmp_dir, "wordcloud.png")
+        with PLOT_LOCK:
+            save_barplot(
+                counts.most_common(params["top"]), plot_labels, params["top"],
+                barplot_filepath, type_=type_)
+            if unstemmed:
+                Plotter(frequencies=unstemmed).save_wordcloud_plot(wc_plot_filepath)
+        for name, path in [("barplot", barplot_filepath), ("wordcloud", wc_plot_filepath)]:
+            if os.path.exists(path):
+                with open(path, "rb") as plot_file:
+                    plots[name] = plot_file.read()
+                os.remove(path)
+        os.rmdir(tmp_dir)
+        return plots
+
+    def run_job(self, job_id):
+        """
+        Fetch and count the comments of the posts of a job,
+        then store its result and plots
+
+        :param job_id: str
+        :return: None
+        """
+        with self.jobs_lock:
+            job = self.jobs[job_id]
+            job["status"] = "running"
+        params = job["params"]
+        local_start = time.time()
+        try:
+            if params["post_id"]:
+                # post IDs are <page_id>_<post_id>
+                page_id = params["post_id"].split("_")[0]
+                post_ids = [params["post_id"]]
+            else:
+                page_id = params["page_id"]
+            access_token = self.conf["page_tokens"].get(page_id, self.conf["access_token"])
+            if params["page_id"]:
+                post_ids = get_page_post_ids(
+                    access_token, page_id, params["n_posts"], scheduler=self.scheduler,
+                    base_url=self.graph_url)
+            n_comments = 0
+            counts = Counter()
+            unstemmed = Counter()
+            for post_id in post_ids:
+                post_counts = self.count_post(access_token, post_id, params)
+                n_comments += post_counts["comments"]
+                counts.update(post_counts["counts"])
+                unstemmed.update(post_counts["unstemmed"])
+            plots = self.make_plots(params, counts, unstemmed)
+        except (facebook.GraphAPIError, requests.RequestException, KeyError, OSError) as e:
+            logger.error("Job {} failed: {}".format(job_id, e))
+            with self.jobs_lock:
+                job.update(status="failed", error=str(e), finished=time.time())
+            return
+        except Exception as e:
+            # a job must never be left running
+            logger.exception("Job {} failed".format(job_id))
+            with self.jobs_lock:
+                job.update(status="failed", error=str(e), finished=time.time())
+            return
+        column = "word" if params["analysis"] == "words" else "entity"
+        result = {
+            "posts": len(post_ids),
+            "comments": n_comments,
+            "counts": [
+                {column: term, "count": count}
+                for term, count in counts.most_common(params["top"])
+            ]
+        }
+        with self.jobs_lock:
+            job.update(status="done", result=result, plots=plots, finished=time.time())
+        logger.info("Job {} done: {} comments from {} post(s) in {} seconds".format(
+            job_id, n_comments, len(post_ids), round((time.time() - local_start), 1)))
+
+    def status(self):
+        """
+        Return the loaded models, the cache stats and the number of jobs by status
+
+        :return: dict
+        """
+        with self.jobs_lock:
+            jobs = Counter(job["status"] for job in self.jobs.values())
+        with self.models_lock:
+            models = sorted(self.models)
+        return {"models": models, "cache": self.cache.stats(), "jobs": dict(jobs)}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+
+
+class Checkpoint(object):
+    def __init__(self, path, every=1):
+        """
+        Json checkpoint of the state of a long run, written atomically
+        so that a crash while saving never leaves a corrupted file behind
+
+        :param path: str: checkpoint file path
+        :param every: int: save() is a no-op except
+            every `every` calls to it, see save()
+        """
+        self.path = path
+        self.every = max(1, every)
+        self.n_updates = 0
+
+    def load(self):
+        """
+        Return the last saved state, or None if there is no checkpoint
+
+        :return: dict or None
+        """
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save(self, state, force=False):
+        """
+        Save a json-serializable state every `every` calls,
+        or right away if force is True. The state is written to a
+        temporary file in the same directory which then replaces
+        the checkpoint
+
+        :param state: dict
+        :param force: bool
+        :return: bool: True if the state was written
+        """
+        self.n_updates += 1
+        if not force and self.n_updates % self.every != 0:
+            return False
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump(state, tmp_file)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return True
+
+    def clear(self):
+        """
+        Remove the checkpoint, e.g. once the run is complete
+
+        :return: None
+        """
+        if os.path.isfile(self.path):
+            os.remove(self.path)
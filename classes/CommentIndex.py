@@ -0,0 +1,108 @@
+import sqlite3
+
+from utils import iter_batches
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT PRIMARY KEY,
+    page_id TEXT,
+    post_id TEXT,
+    created_time TEXT,
+    message TEXT,
+    preprocessed TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+    message,
+    preprocessed,
+    content='comments',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts(rowid, message, preprocessed)
+    VALUES (new.rowid, new.message, new.preprocessed);
+END;
+"""
+COLUMNS = [
+    "page_id", "post_id", "comment_id", "created_time",
+    "message", "preprocessed"
+]
+
+
+class CommentIndex(object):
+    def __init__(self, path, batch_size=1000):
+        """
+        Local SQLite FTS5 full-text index of fetched comments.
+        Comments already in the index, by comment ID, are skipped
+
+        :param path: str: database file path
+        :param batch_size: int: number of comments per transaction
+        """
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def add_comments(self, records):
+        """
+        Bulk insert comments, one transaction per batch
+
+        :param records: iterable of dicts with keys COLUMNS
+        :return: int: number of new comments
+        """
+        query = (
+            "INSERT OR IGNORE INTO comments ({}) VALUES ({})".format(
+                ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+        )
+        n_added = 0
+        for batch in iter_batches(records, self.batch_size):
+            with self.conn:
+                cursor = self.conn.executemany(
+                    query, [[r[c] for c in COLUMNS] for r in batch])
+                n_added += cursor.rowcount
+        return n_added
+
+    @staticmethod
+    def _match_expression(query, raw):
+        if raw:
+            return query
+        return '"{}"'.format(query.replace('"', '""'))
+
+    def search(self, query, page=1, page_size=20, raw=False):
+        """
+        Return the comments matching a word, a stemmed word as shown
+        in the bar plots, or an entity, best matches first
+
+        :param query: str: word or phrase to look for
+        :param page: int: 1-based page number
+        :param page_size: int: number of comments per page
+        :param raw: bool: if True query is passed as an FTS5
+            expression, e.g. "salvini NOT lega"
+        :return: list of dicts with keys COLUMNS
+        """
+        rows = self.conn.execute(
+            "SELECT {} FROM comments_fts JOIN comments "
+            "ON comments.rowid = comments_fts.rowid "
+            "WHERE comments_fts MATCH ? "
+            "ORDER BY bm25(comments_fts) LIMIT ? OFFSET ?".format(
+                ", ".join("comments." + c for c in COLUMNS)),
+            (self._match_expression(query, raw),
+             page_size, (page - 1) * page_size)
+        ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def count(self, query, raw=False):
+        """
+        Return the number of comments matching a given query
+
+        :param query: str
+        :param raw: bool
+        :return: int
+        """
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM comments_fts WHERE comments_fts MATCH ?",
+            (self._match_expression(query, raw),)
+        ).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
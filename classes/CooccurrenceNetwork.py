@@ -0,0 +1,107 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from scipy import sparse
+
+GRAPHML_NS = "http://graphml.graphdrawing.org/xmlns"
+
+
+class CooccurrenceNetwork(object):
+    def __init__(self, comments_entities):
+        """
+        Network of the entities mentioned together in the same comment
+
+        :param comments_entities: list of lists: the entities
+            of each comment, as returned by get_entities
+        """
+        self.entities = []
+        entity_idx = {}
+        rows = []
+        cols = []
+        for comment_idx, entities in enumerate(comments_entities):
+            for entity in set(entities):
+                if entity not in entity_idx:
+                    entity_idx[entity] = len(self.entities)
+                    self.entities.append(entity)
+                rows.append(entity_idx[entity])
+                cols.append(comment_idx)
+        self.n_comments = len(comments_entities)
+        # entity-by-comment incidence matrix
+        self.incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+            shape=(len(self.entities), self.n_comments))
+        self.entity_counts = np.asarray(self.incidence.sum(axis=1)).ravel()
+        # one sparse product gives the co-occurrence counts of every pair,
+        # only the upper triangle is kept so each edge appears once
+        self.cooccurrence = sparse.triu(
+            self.incidence @ self.incidence.T, k=1).tocoo()
+
+    def edges(self, n_edges, weight="count", min_count=1):
+        """
+        Return the top edges of the network as a sorted list of
+        tuples(source, target, count, pmi)
+
+        :param n_edges: int: max number of edges
+        :param weight: str: "count" or "pmi", the ranking criterion
+        :param min_count: int: min co-occurrence count of an edge,
+            useful to discard the noisy PMI of rare pairs
+        :return: list
+        """
+        if weight not in ["count", "pmi"]:
+            raise ValueError("Unsupported edge weight {}".format(weight))
+        src = self.cooccurrence.row
+        dst = self.cooccurrence.col
+        counts = self.cooccurrence.data
+        keep = counts >= min_count
+        src, dst, counts = src[keep], dst[keep], counts[keep]
+        pmi = np.log(
+            counts * self.n_comments /
+            (self.entity_counts[src] * self.entity_counts[dst]).astype(float))
+        ranking = counts if weight == "count" else pmi
+        if len(ranking) > n_edges:
+            top = np.argpartition(-ranking, n_edges - 1)[:n_edges]
+        else:
+            top = np.arange(len(ranking))
+        top = top[np.argsort(-ranking[top], kind="stable")]
+        return [
+            (self.entities[src[i]], self.entities[dst[i]],
+             int(counts[i]), round(float(pmi[i]), 4))
+            for i in top
+        ]
+
+    def save_graphml(self, edges, path):
+        """
+        Save a list of edges as returned by edges() in GraphML format,
+        with the number of comments mentioning each entity as node attribute
+
+        :param edges: list of tuples(source, target, count, pmi)
+        :param path: str: output file path
+        :return: None
+        """
+        ET.register_namespace("", GRAPHML_NS)
+        root = ET.Element("{%s}graphml" % GRAPHML_NS)
+        for key_id, domain, name, type_ in [
+            ("mentions", "node", "mentions", "int"),
+            ("count", "edge", "count", "int"),
+            ("pmi", "edge", "pmi", "double"),
+        ]:
+            ET.SubElement(root, "{%s}key" % GRAPHML_NS, {
+                "id": key_id, "for": domain,
+                "attr.name": name, "attr.type": type_})
+        graph = ET.SubElement(
+            root, "{%s}graph" % GRAPHML_NS, {"edgedefault": "undirected"})
+        entity_idx = {entity: i for i, entity in enumerate(self.entities)}
+        nodes = dict.fromkeys(
+            entity for source, target, _, _ in edges
+            for entity in (source, target))
+        for entity in nodes:
+            node = ET.SubElement(graph, "{%s}node" % GRAPHML_NS, {"id": entity})
+            data = ET.SubElement(node, "{%s}data" % GRAPHML_NS, {"key": "mentions"})
+            data.text = str(int(self.entity_counts[entity_idx[entity]]))
+        for source, target, count, pmi in edges:
+            edge = ET.SubElement(graph, "{%s}edge" % GRAPHML_NS, {
+                "source": source, "target": target})
+            for key, value in [("count", count), ("pmi", pmi)]:
+                data = ET.SubElement(edge, "{%s}data" % GRAPHML_NS, {"key": key})
+                data.text = str(value)
+        ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
@@ -0,0 +1,115 @@
+import json
+import string
+from collections import deque
+
+from classes.TextPreprocessor import TextPreprocessor
+
+PUNCTUATION_TO_SPACE = str.maketrans(
+    string.punctuation, " " * len(string.punctuation))
+
+
+def normalize_text(text):
+    """
+    Lowercase a given string, strip its non-ASCII characters
+    and turn its punctuation into whitespace
+
+    :param text: str
+    :return: list of tokens
+    """
+    text = TextPreprocessor(text.lower()).remove_non_ascii()
+    return text.translate(PUNCTUATION_TO_SPACE).split()
+
+
+class Gazetteer(object):
+    def __init__(self, entities):
+        """
+        Dictionary-based entity matcher: an Aho-Corasick automaton
+        over the tokens of the normalized aliases, so that a comment
+        is scanned once whatever the number of aliases
+
+        :param entities: dict: canonical entity -> list of aliases.
+            The canonical name is always an alias of itself
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        self.n_aliases = 0
+        for canonical, aliases in entities.items():
+            for alias in [canonical] + list(aliases):
+                self._add_alias(normalize_text(alias), canonical)
+        self._build_fail_links()
+
+    @classmethod
+    def from_json(cls, path):
+        """
+        Build a Gazetteer from a json file mapping
+        canonical entities to their aliases
+
+        :param path: str
+        :return: Gazetteer
+        """
+        with open(path, "r", encoding="utf-8") as gazetteer_file:
+            return cls(json.load(gazetteer_file))
+
+    def _add_alias(self, tokens, canonical):
+        if not tokens:
+            return
+        state = 0
+        for token in tokens:
+            if token not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.goto[state][token] = len(self.goto) - 1
+            state = self.goto[state][token]
+        if self.output[state] is None:
+            self.n_aliases += 1
+        self.output[state] = (len(tokens), canonical)
+
+    def _build_fail_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+
+    def _matches(self, tokens):
+        """
+        Yield (start, end, canonical) for every alias found in
+        a list of tokens, overlapping matches included
+        """
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            match_state = state
+            while match_state:
+                if self.output[match_state] is not None:
+                    length, canonical = self.output[match_state]
+                    yield position + 1 - length, position + 1, canonical
+                match_state = self.fail[match_state]
+
+    def find_entities(self, text):
+        """
+        Return the canonical entities mentioned in a given text.
+        Overlapping aliases are resolved leftmost-longest, e.g.
+        "matteo renzi" wins over "renzi"
+
+        :param text: str
+        :return: list
+        """
+        matches = sorted(
+            self._matches(normalize_text(text)),
+            key=lambda m: (m[0], m[0] - m[1]))
+        entities = []
+        last_end = 0
+        for start, end, canonical in matches:
+            if start >= last_end:
+                entities.append(canonical)
+                last_end = end
+        return entities
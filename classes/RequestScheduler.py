@@ -0,0 +1,352 @@
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+# Graph API error codes meaning that a rate limit was reached
+# https://developers.facebook.com/docs/graph-api/overview/rate-limiting
+APP_LIMIT_CODES = [4]
+PAGE_LIMIT_CODES = [32, 80001]
+TOKEN_LIMIT_CODES = [17, 613]
+LIMIT_CODES = APP_LIMIT_CODES + PAGE_LIMIT_CODES + TOKEN_LIMIT_CODES
+APP_USAGE_HEADERS = ["X-App-Usage"]
+PAGE_USAGE_HEADERS = ["X-Page-Usage", "X-Business-Use-Case-Usage"]
+USAGE_HEADERS = APP_USAGE_HEADERS + PAGE_USAGE_HEADERS
+VERSION_RE = re.compile(r"^v\d+(\.\d+)?$")
+
+
+def parse_usage(headers, usage_headers=USAGE_HEADERS):
+    """
+    Return the highest usage percentage reported by the given Graph API
+    usage headers of a response, and the seconds to wait before the
+    access is regained if the response says so
+
+    :param headers: dict-like: response headers
+    :param usage_headers: list of str, optional: headers to look at
+    :return: tuple(float, float)
+    """
+    usage = 0.
+    regain_after = 0.
+    for header in usage_headers:
+        if header not in headers:
+            continue
+        try:
+            value = json.loads(headers[header])
+        except ValueError:
+            continue
+        if header == "X-Business-Use-Case-Usage":
+            reports = [r for rs in value.values() for r in rs]
+        else:
+            reports = [value]
+        for report in reports:
+            usage = max(
+                [usage] + [
+                    float(report.get(k, 0))
+                    for k in ["call_count", "total_cputime", "total_time"]
+                ])
+            regain_after = max(
+                regain_after,
+                60. * float(report.get("estimated_time_to_regain_access", 0)))
+    return usage, regain_after
+
+
+def page_of(url):
+    """
+    Return the ID of the page a Graph API url is about, from the
+    first node of its path: a page ID, or a post ID <page_id>_<post_id>
+
+    :param url: str
+    :return: str or None
+    """
+    nodes = [n for n in urlsplit(url).path.split("/") if n and not VERSION_RE.match(n)]
+    if not nodes:
+        return None
+    return nodes[0].split("_")[0]
+
+
+class RateLimitPause(Exception):
+    def __init__(self, seconds):
+        """
+        Raised instead of waiting for a paused token or page,
+        see RequestScheduler wait_on_pause
+
+        :param seconds: float: time left before the pause ends
+        """
+        super(RateLimitPause, self).__init__(
+            "Paused after a rate limit for {} more seconds".format(round(seconds)))
+        self.seconds = seconds
+
+
+class SchedulerStopped(Exception):
+    """
+    Raised by the requests of a stopped RequestScheduler
+    """
+
+
+class TokenBucket(object):
+    def __init__(self, access_token, rate, burst):
+        """
+        Token bucket rate limiter of the requests made with an access token
+
+        :param access_token: str
+        :param rate: float: max requests per second
+        :param burst: int: max number of requests in a burst
+        """
+        self.access_token = access_token
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.
+        self.usage = 0.
+
+    def ready_at(self, now):
+        """
+        Return the time at which a request can be made
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        refill_at = now + max(0., 1. - self.tokens) / self.rate
+        return max(refill_at, self.blocked_until)
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class RequestScheduler(object):
+    def __init__(self, access_tokens, rate=1., burst=5, max_usage=80.,
+                 cooldown=300., max_retries=3, page_tokens=None, wait_on_pause=True):
+        """
+        Throttle Graph API requests across several access tokens,
+        each with its own token bucket. Page access tokens are only
+        valid for their page, so a request is only ever made with the
+        tokens of the page it is about. The rate of a token is lowered
+        as its usage, as reported by the response headers, approaches
+        max_usage. Limits are tracked at the level Facebook enforces them:
+        once max_usage or an actual rate limit is reached, the token is
+        paused for token-level limits, every request to the page for
+        page-level limits, whatever the token, and every token of every
+        page for app-level limits, long before Facebook locks them out
+
+        :param access_tokens: list of str: tokens of the pages
+            with no tokens in page_tokens
+        :param rate: float: max requests per second per token
+        :param burst: int: max burst of requests per token
+        :param max_usage: float: usage percentage at which a token is paused
+        :param cooldown: float: pause length, in seconds, when
+            the Graph API does not say how long to wait
+        :param max_retries: int: retries of a rate-limited request
+        :param page_tokens: dict, optional: page ID -> list of str,
+            the only tokens used for the requests about that page
+        :param wait_on_pause: bool: wait for a paused token or page,
+            or raise RateLimitPause at once
+        """
+        if not access_tokens and not page_tokens:
+            raise ValueError("At least one access token is required")
+        buckets = {}
+        for token in list(access_tokens) + [
+                t for tokens in (page_tokens or {}).values() for t in tokens]:
+            if token not in buckets:
+                buckets[token] = TokenBucket(token, rate, burst)
+        self.buckets = list(buckets.values())
+        self.default_buckets = [buckets[t] for t in access_tokens]
+        self.page_buckets = {
+            page_id: [buckets[t] for t in tokens]
+            for page_id, tokens in (page_tokens or {}).items() if tokens
+        }
+        self.max_usage = max_usage
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.wait_on_pause = wait_on_pause
+        self.stopped = threading.Event()
+        self.page_blocked_until = {}
+        self.page_usage = {}
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.counter = itertools.count()
+
+    @classmethod
+    def from_conf(cls, conf, n_processes=1, max_retries=3, wait_on_pause=True):
+        """
+        Build the scheduler of the tokens of a configuration: the token
+        in page_tokens of a page, or access_token and extra_access_tokens
+        for page_id, and access_token for any other page. The requests
+        per second of each token are shared by n_processes processes
+
+        :param conf: dict: configuration, as loaded from settings.conf
+        :param n_processes: int
+        :param max_retries: int: retries of a rate-limited request
+        :param wait_on_pause: bool: see RequestScheduler
+        :return: RequestScheduler
+        """
+        page_tokens = {
+            page_id: [token] for page_id, token in conf.get("page_tokens", {}).items()
+        }
+        page_tokens.setdefault(
+            conf["page_id"], [conf["access_token"]] + conf.get("extra_access_tokens", []))
+        return cls(
+            [conf["access_token"]],
+            rate=conf.get("requests_per_second", 1.) / n_processes,
+            max_usage=conf.get("max_usage_percent", 80.),
+            max_retries=max_retries, page_tokens=page_tokens, wait_on_pause=wait_on_pause)
+
+    def _acquire(self, page_id=None):
+        """
+        Reserve a request on the token of the page that is ready
+        first and wait until both the token and the page are ready
+
+        :param page_id: str or None
+        :return: TokenBucket
+        :raise RateLimitPause: if the token or the page is paused
+            and wait_on_pause is False
+        :raise SchedulerStopped: if the scheduler is stopped
+        """
+        buckets = self.page_buckets.get(page_id, self.default_buckets)
+        if not buckets:
+            raise ValueError("No access token for page {}".format(page_id))
+        if self.stopped.is_set():
+            raise SchedulerStopped()
+        with self.lock:
+            now = time.monotonic()
+            bucket = min(buckets, key=lambda b: b.ready_at(now))
+            blocked_until = max(bucket.blocked_until, self.page_blocked_until.get(page_id, 0.))
+            if blocked_until > now and not self.wait_on_pause:
+                raise RateLimitPause(blocked_until - now)
+            wait = max(bucket.ready_at(now), blocked_until) - now
+            bucket.consume()
+        if wait > 0 and self.stopped.wait(wait):
+            raise SchedulerStopped()
+        return bucket
+
+    def blocked_for(self, page_id=None):
+        """
+        Return the seconds left before a request to a page can be
+        made again, with any of its tokens, after a rate limit
+
+        :param page_id: str or None
+        :return: float
+        """
+        buckets = self.page_buckets.get(page_id, self.default_buckets)
+        with self.lock:
+            now = time.monotonic()
+            blocked_until = self.page_blocked_until.get(page_id, 0.)
+            if buckets:
+                blocked_until = max(blocked_until, min(b.blocked_until for b in buckets))
+        return max(0., blocked_until - now)
+
+    def _update(self, bucket, page_id, response, data):
+        """
+        Adapt the rate of a token to its usage headers and, when
+        rate-limited, pause the token, the page or the whole app
+        """
+        app_usage, app_regain_after = parse_usage(response.headers, APP_USAGE_HEADERS)
+        page_usage, page_regain_after = parse_usage(response.headers, PAGE_USAGE_HEADERS)
+        error_code = None
+        if isinstance(data, dict) and isinstance(data.get("error"), dict):
+            error_code = data["error"].get("code")
+        with self.lock:
+            now = time.monotonic()
+            bucket.usage = max(app_usage, page_usage)
+            headroom = max(0., self.max_usage - bucket.usage) / self.max_usage
+            bucket.rate = bucket.base_rate * max(0.1, headroom)
+            if page_id is not None:
+                self.page_usage[page_id] = page_usage
+            paused = []
+            if error_code in APP_LIMIT_CODES or app_usage >= self.max_usage:
+                paused.append((self.buckets, app_regain_after or self.cooldown))
+            if error_code in PAGE_LIMIT_CODES or page_usage >= self.max_usage:
+                pause = page_regain_after or self.cooldown
+                if page_id is None:
+                    # the page is unknown, play it safe
+                    paused.append((self.buckets, pause))
+                else:
+                    self.page_blocked_until[page_id] = max(
+                        self.page_blocked_until.get(page_id, 0.), now + pause)
+            if error_code in TOKEN_LIMIT_CODES:
+                paused.append(([bucket], max(app_regain_after, page_regain_after) or self.cooldown))
+            for buckets, pause in paused:
+                for b in buckets:
+                    b.blocked_until = max(b.blocked_until, now + pause)
+        return error_code in LIMIT_CODES
+
+    def get(self, url, page_id=None):
+        """
+        Make a GET request to the Graph API with the first available
+        access token of the page, replacing any access token already in the url,
+        e.g. in paging urls
+
+        :param url: str
+        :param page_id: str, optional: page the request is about,
+            defaults to the page of the url, see page_of()
+        :return: dict: decoded json response, or a Graph API-like
+            error dict if the response is not json
+        """
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = [(k, v) for k, v in parse_qsl(query) if k != "access_token"]
+        if page_id is None:
+            page_id = page_of(url)
+        for _ in range(self.max_retries + 1):
+            bucket = self._acquire(page_id)
+            token_query = urlencode(params + [("access_token", bucket.access_token)])
+            response = requests.get(
+                urlunsplit((scheme, netloc, path, token_query, fragment)))
+            try:
+                data = response.json()
+            except ValueError:
+                data = {"error": {
+                    "message": "Invalid response, HTTP status {}".format(response.status_code),
+                    "code": None
+                }}
+            if not self._update(bucket, page_id, response, data):
+                break
+        return data
+
+    def stop(self):
+        """
+        Make every request, including those waiting for their
+        token or page, raise SchedulerStopped, so that running
+        jobs stop at their next request instead of completing
+
+        :return: None
+        """
+        self.stopped.set()
+
+    def submit(self, priority, key, func, *args, **kwargs):
+        """
+        Queue a job, lower priority values run first
+
+        :param priority: number
+        :param key: job identifier returned by run()
+        :param func: callable
+        :return: None
+        """
+        heapq.heappush(
+            self.jobs, (priority, next(self.counter), key, func, args, kwargs))
+
+    def run(self, n_workers=1):
+        """
+        Run the queued jobs by priority with a pool of n_workers
+        threads, and yield tuples(key, result) as jobs complete.
+        Pending jobs are cancelled if the caller stops iterating
+        or a job raises
+
+        :param n_workers: int
+        :return: generator of tuples
+        """
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+        futures = {}
+        try:
+            while self.jobs:
+                _, _, key, func, args, kwargs = heapq.heappop(self.jobs)
+                futures[executor.submit(func, *args, **kwargs)] = key
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,42 @@
+import random
+
+
+class ReservoirSampler(object):
+    def __init__(self, size, seed=None):
+        """
+        Uniform random sample of fixed size over a stream of unknown
+        length (Algorithm R): memory is bounded by the sample size,
+        whatever the number of items seen
+
+        :param size: int: sample size
+        :param seed: int, optional
+        """
+        self.size = size
+        self.sample = []
+        self.n_seen = 0
+        self.rng = random.Random(seed)
+
+    def add(self, item):
+        """
+        Offer an item to the sample
+
+        :param item: any
+        :return: None
+        """
+        self.n_seen += 1
+        if len(self.sample) < self.size:
+            self.sample.append(item)
+        else:
+            idx = self.rng.randrange(self.n_seen)
+            if idx < self.size:
+                self.sample[idx] = item
+
+    def extend(self, items):
+        """
+        Offer all the items of an iterable to the sample
+
+        :param items: iterable
+        :return: None
+        """
+        for item in items:
+            self.add(item)
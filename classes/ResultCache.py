@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache(object):
+    def __init__(self, max_size=256, ttl=3600.):
+        """
+        Thread-safe in-memory cache of analysis results. The least
+        recently used entry is evicted once max_size entries are
+        stored, and entries older than ttl seconds are never returned
+
+        :param max_size: int: max number of entries
+        :param ttl: float: time to live of an entry, in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value cached for a key
+
+        :param key: hashable
+        :return: any or None if the key is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """
+        Cache a value, evicting the least recently used
+        entries if the cache is full
+
+        :param key: hashable
+        :param value: any
+        :return: None
+        """
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Return the number of entries, hits and misses
+
+        :return: dict
+        """
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,144 @@
+import math
+from collections import Counter
+
+from scipy import sparse
+from sklearn.decomposition import LatentDirichletAllocation, MiniBatchNMF
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+SUPPORTED_METHODS = ["nmf", "lda"]
+
+
+class TopicModeler(object):
+    def __init__(self, n_topics=10, method="nmf", max_features=5000,
+                 min_df=2, n_epochs=1, n_jobs=-1, random_state=0):
+        """
+        Topic extraction over preprocessed comments, fitted in minibatches
+        so that the corpus never has to fit in memory
+
+        :param n_topics: int: number of topics to extract
+        :param method: str: "nmf" (TF-IDF + MiniBatchNMF) or
+            "lda" (term counts + online LDA)
+        :param max_features: int: max vocabulary size
+        :param min_df: int: min number of documents a term must appear in
+        :param n_epochs: int: number of passes over the corpus
+        :param n_jobs: int: number of cores used by LDA, -1 means all
+        :param random_state: int
+        """
+        if method not in SUPPORTED_METHODS:
+            raise ValueError(
+                "Unsupported topic method {}. Supported: {}".format(
+                    method, SUPPORTED_METHODS))
+        self.n_topics = n_topics
+        self.method = method
+        self.max_features = max_features
+        self.min_df = min_df
+        self.n_epochs = n_epochs
+        self.vectorizer = None
+        self.idf = None
+        self.n_docs = 0
+        if method == "nmf":
+            self.model = MiniBatchNMF(
+                n_components=n_topics, random_state=random_state)
+        else:
+            self.model = LatentDirichletAllocation(
+                n_components=n_topics,
+                learning_method="online",
+                n_jobs=n_jobs,
+                random_state=random_state
+            )
+
+    def fit_vocabulary(self, batches):
+        """
+        Stream over the corpus once to collect document frequencies
+        and build the vocabulary and the IDF weights
+
+        :param batches: iterable of lists of preprocessed comments
+        :return: int: number of terms in the vocabulary
+        """
+        doc_freq = Counter()
+        self.n_docs = 0
+        for batch in batches:
+            for doc in batch:
+                doc_freq.update(set(doc.split()))
+            self.n_docs += len(batch)
+        terms = [
+            term for term, df in doc_freq.most_common(self.max_features)
+            if df >= self.min_df
+        ]
+        self.vectorizer = CountVectorizer(
+            vocabulary=terms, analyzer=str.split)
+        # Same smoothed IDF as sklearn's TfidfTransformer
+        self.idf = sparse.diags([
+            math.log((1 + self.n_docs) / (1 + doc_freq[term])) + 1
+            for term in terms
+        ])
+        return len(terms)
+
+    def vectorize(self, batch):
+        """
+        Return the sparse document-term matrix of a batch of comments,
+        TF-IDF weighted when the method is NMF
+
+        :param batch: list of preprocessed comments
+        :return: scipy.sparse.csr_matrix
+        """
+        X = self.vectorizer.transform(batch)
+        if self.method == "nmf":
+            X = normalize(X @ self.idf)
+        return X
+
+    def fit(self, batches_factory):
+        """
+        Fit the vocabulary and the topic model in minibatches
+
+        :param batches_factory: callable returning a fresh iterable
+            of lists of preprocessed comments at every call
+        :return: self
+        """
+        n_terms = self.fit_vocabulary(batches_factory())
+        if n_terms < self.n_topics:
+            raise ValueError(
+                "Vocabulary of {} terms is too small for {} topics".format(
+                    n_terms, self.n_topics))
+        if self.method == "lda":
+            # online LDA scales its minibatch updates by the corpus size
+            self.model.set_params(total_samples=self.n_docs)
+        for _ in range(self.n_epochs):
+            for batch in batches_factory():
+                X = self.vectorize(batch)
+                if X.nnz > 0:
+                    self.model.partial_fit(X)
+        return self
+
+    def transform(self, batch):
+        """
+        Return the topic weights of each comment in a batch,
+        normalized to sum to one
+
+        :param batch: list of preprocessed comments
+        :return: numpy.ndarray of shape (len(batch), n_topics)
+        """
+        weights = self.model.transform(self.vectorize(batch))
+        return normalize(weights, norm="l1")
+
+    def top_terms(self, n_terms):
+        """
+        Return the top terms of each topic, with their share
+        of the topic weight
+
+        :param n_terms: int: number of terms per topic
+        :return: list of lists of tuples(term, weight)
+        """
+        vocabulary = self.vectorizer.get_feature_names_out()
+        topics = []
+        for component in self.model.components_:
+            total = component.sum()
+            if total > 0:
+                component = component / total
+            top_idx = component.argsort()[::-1][:n_terms]
+            topics.append([
+                (vocabulary[i], round(float(component[i]), 4))
+                for i in top_idx
+            ])
+        return topics
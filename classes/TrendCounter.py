@@ -0,0 +1,163 @@
+import math
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+BUCKET_SECONDS = {"hour": 3600, "day": 86400, "week": 604800}
+# 1970-01-01 is a Thursday, weeks are aligned on Mondays instead
+BUCKET_ORIGIN = {"hour": 0, "day": 0, "week": 4 * 86400}
+FACEBOOK_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def parse_created_time(created_time):
+    """
+    Return a timezone-aware datetime from a Graph API created_time
+
+    :param created_time: str, e.g. 2019-11-18T21:14:06+0000
+    :return: datetime
+    """
+    return datetime.strptime(created_time, FACEBOOK_TIME_FORMAT)
+
+
+class TrendCounter(object):
+    def __init__(self, bucket="day", window=7):
+        """
+        Per-bucket term counters over comment timestamps, swept in
+        time order with a ring of the last `window` bucket counters.
+        Only non-empty buckets are stored. They are all kept, since
+        comments arrive one post at a time rather than in time order,
+        and the line plot needs the history of the overall top terms
+
+        :param bucket: str: bucket size, one of BUCKET_SECONDS
+        :param window: int: rolling window size, in buckets
+        """
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError("Unsupported bucket {}. Supported: {}".format(
+                bucket, list(BUCKET_SECONDS)))
+        self.bucket = bucket
+        self.bucket_seconds = BUCKET_SECONDS[bucket]
+        self.origin = BUCKET_ORIGIN[bucket]
+        self.window = window
+        self.buckets = {}
+
+    def _bucket_key(self, timestamp):
+        seconds = int(timestamp.timestamp()) - self.origin
+        return seconds - seconds % self.bucket_seconds + self.origin
+
+    def _bucket_start(self, key):
+        return datetime.fromtimestamp(key, tz=timezone.utc)
+
+    def add(self, timestamp, terms):
+        """
+        Count the terms of a comment in the bucket of its timestamp
+
+        :param timestamp: datetime
+        :param terms: iterable of str
+        :return: None
+        """
+        key = self._bucket_key(timestamp)
+        if key not in self.buckets:
+            self.buckets[key] = Counter()
+        self.buckets[key].update(terms)
+
+    def _expire(self, ring, window_counts, oldest_key):
+        """
+        Pop the buckets older than oldest_key from the ring and
+        subtract their counts from the window counts
+        """
+        while ring and ring[0][0] < oldest_key:
+            _, expired = ring.popleft()
+            window_counts.subtract(expired)
+            for term in expired:
+                if window_counts[term] <= 0:
+                    del window_counts[term]
+
+    def sweep(self):
+        """
+        Yield, for every non-empty bucket in time order, a tuple
+        (bucket_start, bucket_counts, window_counts, emerging_scores).
+        The window counts are updated incrementally, adding the new bucket
+        and subtracting the ones leaving the ring, so the comments are never
+        recounted, and empty buckets are skipped rather than walked through.
+        The emerging score of a term compares its count in the bucket with
+        its mean count over the previous window, empty buckets included
+
+        :return: generator of tuples(datetime, Counter, Counter, dict)
+        """
+        ring = deque()
+        window_counts = Counter()
+        window_seconds = self.window * self.bucket_seconds
+        first_key = None
+        for key in sorted(self.buckets):
+            if first_key is None:
+                first_key = key
+            counts = self.buckets[key]
+            self._expire(ring, window_counts, key - window_seconds)
+            n_previous = min(self.window, (key - first_key) // self.bucket_seconds)
+            scores = {}
+            if n_previous > 0:
+                for term, count in counts.items():
+                    baseline = window_counts[term] / n_previous
+                    scores[term] = (count - baseline) / math.sqrt(baseline + 1)
+            ring.append((key, counts))
+            window_counts.update(counts)
+            self._expire(ring, window_counts, key - window_seconds + self.bucket_seconds)
+            yield self._bucket_start(key), counts, window_counts, scores
+
+    def trend_table(self, n_top):
+        """
+        Return, for every non-empty bucket, the rolling top-N terms and the top-N
+        emerging terms as a list of tuples
+        (bucket_start, term, count, window_count, emerging_score)
+
+        :param n_top: int
+        :return: list
+        """
+        table = []
+        for bucket_start, counts, window_counts, scores in self.sweep():
+            top_terms = [term for term, _ in window_counts.most_common(n_top)]
+            emerging = sorted(
+                (term for term in scores if scores[term] > 0),
+                key=lambda t: scores[t], reverse=True)[:n_top]
+            for term in dict.fromkeys(top_terms + emerging):
+                table.append((
+                    bucket_start.isoformat(), term, counts[term],
+                    window_counts[term], round(scores.get(term, 0.), 3)
+                ))
+        return table
+
+    def series(self, terms):
+        """
+        Return the per-bucket counts of the given terms, over the
+        non-empty buckets and the empty buckets at the edges of each gap
+        between them, so that a line plot drops to zero over the gap
+
+        :param terms: list of str
+        :return: tuple(list of datetime, dict term -> list of int)
+        """
+        starts = []
+        counts = {term: [] for term in terms}
+        previous_key = None
+        for key in sorted(self.buckets):
+            if previous_key is not None:
+                gap_keys = [previous_key + self.bucket_seconds, key - self.bucket_seconds]
+                for gap_key in sorted(set(k for k in gap_keys if previous_key < k < key)):
+                    starts.append(self._bucket_start(gap_key))
+                    for term in terms:
+                        counts[term].append(0)
+            starts.append(self._bucket_start(key))
+            bucket_counts = self.buckets[key]
+            for term in terms:
+                counts[term].append(bucket_counts[term])
+            previous_key = key
+        return starts, counts
+
+    def total_counts(self):
+        """
+        Return the overall term counts as a sorted list of tuples
+
+        :return: list
+        """
+        total = Counter()
+        for counts in self.buckets.values():
+            total.update(counts)
+        return total.most_common()
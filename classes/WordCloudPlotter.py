@@ -2,12 +2,15 @@ from wordcloud import WordCloud
 
 
 class Plotter(object):
-    def __init__(self, long_string):
+    def __init__(self, long_string="", frequencies=None):
         """
         :param long_string:  str: Whitespace concatenation of
             all the words in a given corpus
+        :param frequencies: dict, optional: word -> count, used
+            instead of long_string when already counted
         """
         self.long_string = long_string
+        self.frequencies = frequencies
 
     def save_wordcloud_plot(self, path):
         """
@@ -23,7 +26,10 @@ class Plotter(object):
             contour_width=3,
             contour_color="steelblue"
         )
-        wc.generate(self.long_string)
+        if self.frequencies:
+            wc.generate_from_frequencies(self.frequencies)
+        else:
+            wc.generate(self.long_string)
         wc.to_file(path)
 
     def plot_wordcloud(self):
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import time
+from collections import Counter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE,
+    payload TEXT,
+    status TEXT DEFAULT 'pending',
+    worker TEXT,
+    leased_until REAL,
+    attempts INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, task_id);
+CREATE TABLE IF NOT EXISTS results (
+    task_id INTEGER PRIMARY KEY,
+    worker TEXT,
+    counters TEXT
+);
+"""
+
+
+class WorkQueue(object):
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        """
+        SQLite-backed work queue shared by the worker processes.
+        A claimed task is leased to its worker: if the worker dies,
+        the task goes back to the queue once the lease expires
+
+        :param path: str: database file path
+        :param lease_seconds: float: time a worker has to complete a task
+        :param max_attempts: int: claims of a task before it is marked failed
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # WAL needs shared memory on a single host, the rollback
+        # journal only needs file locks, so that workers can run on
+        # several hosts sharing the queue file
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    def enqueue(self, tasks):
+        """
+        Add tasks to the queue, tasks already queued are skipped
+
+        :param tasks: iterable of tuples(key, payload dict)
+        :return: int: number of new tasks
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        cursor = self.conn.executemany(
+            "INSERT OR IGNORE INTO tasks (key, payload) VALUES (?, ?)",
+            [(key, json.dumps(payload)) for key, payload in tasks])
+        self.conn.execute("COMMIT")
+        return cursor.rowcount
+
+    def claim(self, worker):
+        """
+        Lease the oldest pending task that is not postponed, or the
+        oldest task whose lease has expired, to a worker
+
+        :param worker: str: worker identifier
+        :return: tuple(task_id, key, payload dict) or None if
+            there is nothing left to do
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed' WHERE status = 'running' "
+                "AND leased_until < ? AND attempts >= ?",
+                (now, self.max_attempts))
+            row = self.conn.execute(
+                "SELECT task_id, key, payload FROM tasks "
+                "WHERE (status = 'pending' AND (leased_until IS NULL OR leased_until < ?)) "
+                "OR (status = 'running' AND leased_until < ?) "
+                "ORDER BY task_id LIMIT 1", (now, now)).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'running', worker = ?, "
+                    "leased_until = ?, attempts = attempts + 1 WHERE task_id = ?",
+                    (worker, now + self.lease_seconds, row[0]))
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def complete(self, task_id, worker, counters):
+        """
+        Store the partial counters of a task and mark it as done,
+        in the same transaction
+
+        :param task_id: int
+        :param worker: str
+        :param counters: dict: name -> Counter
+        :return: None
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results (task_id, worker, counters) VALUES (?, ?, ?)",
+            (task_id, worker, json.dumps(counters)))
+        self.conn.execute(
+            "UPDATE tasks SET status = 'done', leased_until = NULL WHERE task_id = ?",
+            (task_id,))
+        self.conn.execute("COMMIT")
+
+    def fail(self, task_id, worker):
+        """
+        Put a task back in the queue, or mark it as failed
+        if it was claimed max_attempts times already. Nothing is
+        done if the task is no longer leased to the worker
+
+        :param task_id: int
+        :param worker: str
+        :return: bool: whether the task was still leased to the worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' "
+            "ELSE 'pending' END, leased_until = NULL "
+            "WHERE task_id = ? AND worker = ? AND status = 'running'",
+            (self.max_attempts, task_id, worker))
+        return cursor.rowcount > 0
+
+    def postpone(self, task_id, worker, delay):
+        """
+        Put a task back in the queue, not to be claimed again before
+        delay seconds, e.g. when it was rate-limited. Unlike fail(),
+        the claim is not counted as an attempt. Nothing is done if
+        the task is no longer leased to the worker
+
+        :param task_id: int
+        :param worker: str
+        :param delay: float: seconds
+        :return: bool: whether the task was still leased to the worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = 'pending', leased_until = ?, "
+            "attempts = MAX(0, attempts - 1) "
+            "WHERE task_id = ? AND worker = ? AND status = 'running'",
+            (time.time() + delay, task_id, worker))
+        return cursor.rowcount > 0
+
+    def status(self):
+        """
+        Return the number of tasks by status
+
+        :return: dict
+        """
+        return dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def reduce(self):
+        """
+        Merge the partial counters of all the completed tasks
+
+        :return: dict: name -> Counter
+        """
+        merged = {}
+        for (counters,) in self.conn.execute("SELECT counters FROM results"):
+            for name, counter in json.loads(counters).items():
+                if name not in merged:
+                    merged[name] = Counter()
+                merged[name].update(counter)
+        return merged
+
+    def close(self):
+        self.conn.close()
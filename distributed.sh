@@ -0,0 +1,23 @@
+#!/bin/bash
+function usage()
+{
+    echo ""
+    echo -e "\tInstructions"
+    echo ""
+    echo -e "\tsource distributed.sh <path/to/config-file> <path/to/queue.db> enqueue [--pages ID ...]"
+    echo -e "\tsource distributed.sh <path/to/config-file> <path/to/queue.db> work [--processes N] [--ner-mode MODE] [--lang it|en]"
+    echo -e "\tsource distributed.sh <path/to/config-file> <path/to/queue.db> reduce [--output-dir DIR]"
+    echo ""
+}
+
+CONFIG=$1
+QUEUE=$2
+if [[ -z $CONFIG || -z $QUEUE || -z $3 ]]; then
+    echo "ERROR :: Config file, queue or command not specified"
+    echo "Please specify the config-file path, the queue path and the command to run"
+    echo -e "\a"
+    usage
+else
+    echo "INFO :: Running distributed $3 using config file:" $CONFIG
+    python ./run_distributed.py --conf $CONFIG --queue $QUEUE "${@:3}"
+fi
\ No newline at end of file
@@ -4,7 +4,7 @@ function usage()
     echo ""
     echo -e "\tInstructions"
     echo ""
-    echo -e "\tsource ner_latest.sh <path/to/config-file>"
+    echo -e "\tsource ner_latest.sh <path/to/config-file> [--ner-mode spacy|gazetteer|prefilter] [--cooccurrence count|pmi] [--index] [--resume] [--sample N] [--time-budget S]"
     echo ""
 }
 
@@ -16,5 +16,5 @@ if [[ -z $CONFIG ]]; then
     usage
 else
     echo "INFO :: Running Named-Entity Recognition using config file:" $CONFIG
-    python ./run_ner_latest.py --conf $CONFIG
+    python ./run_ner_latest.py --conf $CONFIG "${@:2}"
 fi
\ No newline at end of file
@@ -0,0 +1,277 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from collections import Counter
+
+import facebook
+import requests
+import spacy
+
+from classes.Gazetteer import Gazetteer
+from classes.RequestScheduler import RequestScheduler, RateLimitPause, LIMIT_CODES
+from classes.TextPreprocessor import TextPreprocessor
+from classes.WordCloudPlotter import Plotter
+from classes.WorkQueue import WorkQueue
+from utils import (
+    get_logger, load_config, get_post_data, get_comments, check_n_posts,
+    create_nonexistent_dir, data_to_tsv, save_barplot, extract_entities
+)
+
+logger = get_logger(__name__)
+logger.setLevel(logging.DEBUG)
+# seconds a worker waits when the only tasks left are postponed or running
+POLL_SECONDS = 10
+
+
+def process_post(access_token, post_id, nlp=None, gazetteer=None, scheduler=None):
+    """
+    Fetch, preprocess and run NER on the comments of a given post
+    and return its partial counters
+
+    :param access_token: str
+    :param post_id: str
+    :param nlp: spaCy model or None
+    :param gazetteer: classes.Gazetteer.Gazetteer or None
+    :param scheduler: classes.RequestScheduler.RequestScheduler or None
+    :return: dict: name -> Counter
+    """
+    post_data = get_post_data(
+        access_token, post_id, raise_on_error=True, scheduler=scheduler)
+    comments = get_comments(post_data)
+    words = Counter()
+    unstemmed_words = Counter()
+    entities = Counter()
+    for comment in comments:
+        words.update(TextPreprocessor(comment).preprocess().split())
+        unstemmed_words.update(TextPreprocessor(comment).base_preprocess().split())
+        if nlp is not None or gazetteer is not None:
+            entities.update(extract_entities(comment, nlp, gazetteer))
+    return {
+        "words": words,
+        "unstemmed_words": unstemmed_words,
+        "entities": entities,
+        "stats": Counter({"posts": 1, "comments": len(comments)})
+    }
+
+
+def enqueue(conf, queue_path, page_ids):
+    """
+    Queue one task per post of the latest posts of the given pages
+    """
+    n_posts = check_n_posts()
+    if not n_posts.isdigit() and n_posts != "-1":
+        logger.error("Please give a number. Exiting")
+        sys.exit(0)
+    queue = WorkQueue(queue_path)
+    for page_id in page_ids:
+        access_token = conf["page_tokens"].get(page_id, conf["access_token"])
+        try:
+            graph = facebook.GraphAPI(access_token)
+            profile = graph.get_object(page_id)
+        except facebook.GraphAPIError as e:
+            logger.error("Could not log in for page {}. {}".format(page_id, e))
+            continue
+        posts = graph.get_connections(profile["id"], "posts", limit=n_posts)
+        n_queued = queue.enqueue(
+            (post["id"], {"page_id": page_id}) for post in posts["data"])
+        logger.info("Queued {} new post(s) of page {}".format(n_queued, page_id))
+    logger.info("Queue {} status: {}".format(queue_path, queue.status()))
+    queue.close()
+
+
+def postpone(queue, task_id, worker_id, post_id, delay):
+    """
+    Put a rate-limited post back in the queue for delay seconds
+    """
+    if queue.postpone(task_id, worker_id, delay):
+        logger.warning("Worker {} was rate-limited on post {}, postponed by {} seconds".format(
+            worker_id, post_id, round(delay)))
+
+
+def work(conf, queue_path, ner_mode=None, lang=None, n_processes=1):
+    """
+    Process queued tasks until every task is either done or failed
+    """
+    worker_id = "{}-{}".format(socket.gethostname(), os.getpid())
+    nlp = None
+    gazetteer = None
+    if ner_mode in ["spacy", "prefilter"]:
+        nlp = spacy.load(conf[lang])
+    if ner_mode in ["gazetteer", "prefilter"]:
+        gazetteer = Gazetteer.from_json(conf["gazetteer_path"])
+    queue = WorkQueue(queue_path, lease_seconds=conf["task_lease_seconds"])
+    # one scheduler for all the pages, so that app-level limits pause them all,
+    # the requests per second of each token are shared by the processes of this host.
+    # Rate-limited posts are neither retried nor kept waiting by the scheduler,
+    # possibly past their lease, but go straight back to the queue
+    scheduler = RequestScheduler.from_conf(
+        conf, n_processes, max_retries=0, wait_on_pause=False)
+    n_done = 0
+    while True:
+        task = queue.claim(worker_id)
+        if task is None:
+            status = queue.status()
+            if status.get("pending", 0) == 0 and status.get("running", 0) == 0:
+                break
+            # the tasks left are postponed after a rate limit, or running on
+            # other workers, which may die and leave them to be claimed again
+            time.sleep(POLL_SECONDS)
+            continue
+        task_id, post_id, payload = task
+        access_token = conf["page_tokens"].get(payload["page_id"], conf["access_token"])
+        local_start = time.time()
+        try:
+            counters = process_post(access_token, post_id, nlp, gazetteer, scheduler)
+        except facebook.GraphAPIError as e:
+            if e.code not in LIMIT_CODES:
+                logger.warning("Worker {} could not process post {}: {}".format(
+                    worker_id, post_id, e))
+                queue.fail(task_id, worker_id)
+                continue
+            # for as long as Facebook says it takes to regain access
+            postpone(queue, task_id, worker_id, post_id,
+                     scheduler.blocked_for(payload["page_id"]) or scheduler.cooldown)
+            continue
+        except RateLimitPause as e:
+            postpone(queue, task_id, worker_id, post_id, e.seconds)
+            continue
+        except requests.RequestException as e:
+            logger.warning("Worker {} could not process post {}: {}".format(
+                worker_id, post_id, e))
+            queue.fail(task_id, worker_id)
+            continue
+        queue.complete(task_id, worker_id, counters)
+        n_done += 1
+        logger.info("Worker {} processed {} comments of post {} in {} seconds".format(
+            worker_id, counters["stats"]["comments"], post_id,
+            round((time.time() - local_start), 1)))
+    logger.info("Worker {} done: {} task(s) processed".format(worker_id, n_done))
+    queue.close()
+
+
+def reduce(conf, queue_path, output_dir):
+    """
+    Merge the partial counters of all the processed tasks and save
+    the same TSV files and plots as the run_* scripts
+    """
+    queue = WorkQueue(queue_path)
+    status = queue.status()
+    if status.get("pending", 0) or status.get("running", 0):
+        logger.warning("Queue {} is not empty, results will be partial: {}".format(
+            queue_path, status))
+    merged = queue.reduce()
+    queue.close()
+    if not merged or merged["stats"]["comments"] == 0:
+        logger.error("Could not find any processed comments. Exiting gracefully")
+        sys.exit(0)
+    logger.info("Merged counters of {} comments from {} post(s)".format(
+        merged["stats"]["comments"], merged["stats"]["posts"]))
+    run_name = os.path.splitext(os.path.basename(queue_path))[0]
+    data_dir_path = os.path.join(output_dir, conf["data_dir_name"])
+    plots_dir_path = os.path.join(output_dir, conf["plots_dir_name"])
+    create_nonexistent_dir(data_dir_path)
+    create_nonexistent_dir(plots_dir_path)
+    wordcount_data = merged["words"].most_common()
+    data_filepath = os.path.join(
+        data_dir_path, "{}_{}.tsv".format(conf["data_wc_prefix"], run_name))
+    data_to_tsv(wordcount_data, ["word", "count"], data_filepath)
+    logger.info("Saved {} words and their counts in {} ".format(
+        len(wordcount_data), data_filepath))
+    barplot_filepath = os.path.join(
+        plots_dir_path, "{}_{}.png".format(conf["barplot_filename"], run_name))
+    save_barplot(wordcount_data, ["Words", "Counts"], conf["n_top_words"], barplot_filepath)
+    logger.info("Bar plot saved at {}".format(barplot_filepath))
+    wc_plot_filepath = os.path.join(
+        plots_dir_path, "{}_{}.png".format(conf["wc_plot_filename"], run_name))
+    Plotter(frequencies=merged["unstemmed_words"]).save_wordcloud_plot(wc_plot_filepath)
+    logger.info("Wordcloud plot saved at {}".format(wc_plot_filepath))
+    entities_data = merged.get("entities", Counter()).most_common()
+    if entities_data:
+        data_filepath = os.path.join(
+            data_dir_path, "{}_{}.tsv".format(conf["data_entities_prefix"], run_name))
+        data_to_tsv(entities_data, ["entities", "count"], data_filepath)
+        logger.info("Saved {} unique entities and their counts in {} ".format(
+            len(entities_data), data_filepath))
+        barplot_filepath = os.path.join(
+            plots_dir_path, "{}_{}_ner.png".format(conf["barplot_filename"], run_name))
+        save_barplot(
+            entities_data, ["Entities", "Counts"], conf["n_top_entities"],
+            barplot_filepath, type_="entities")
+        logger.info("Bar plot saved at {}".format(barplot_filepath))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Count words and entities of many posts with several workers""")
+    parser.add_argument(
+        '-c', '--conf', type=str, metavar='', required=True,
+        help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-q', '--queue', type=str, metavar='', required=True,
+        help='Path of the SQLite work queue, shared by all the workers')
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    enqueue_parser = subparsers.add_parser(
+        "enqueue", help="Queue the latest posts of one or more pages")
+    enqueue_parser.add_argument(
+        '--pages', type=str, metavar='', nargs='+', default=None,
+        help='Page IDs to queue, defaults to page_id in the conf file')
+    work_parser = subparsers.add_parser(
+        "work", help="Process queued posts until the queue is empty")
+    work_parser.add_argument(
+        '-p', '--processes', type=int, metavar='', default=1,
+        help='Number of worker processes to start on this host')
+    work_parser.add_argument(
+        '-m', '--ner-mode', type=str, metavar='', default=None,
+        choices=["spacy", "gazetteer", "prefilter"],
+        help='Also extract entities with spacy, gazetteer or prefilter')
+    work_parser.add_argument(
+        '-l', '--lang', type=str, metavar='', default=None, choices=["it", "en"],
+        help='Language of the spaCy model, required by spacy and prefilter')
+    reduce_parser = subparsers.add_parser(
+        "reduce", help="Merge the results of the workers into TSV files and plots")
+    reduce_parser.add_argument(
+        '-o', '--output-dir', type=str, metavar='', default=None,
+        help='Output directory, defaults to page_id in the conf file')
+    args = parser.parse_args()
+    start = time.time()
+    conf = load_config(args.conf)
+    required_keys = [
+        "access_token", "page_id", "page_tokens", "task_lease_seconds",
+        "extra_access_tokens", "requests_per_second", "max_usage_percent",
+        "data_dir_name", "plots_dir_name", "data_wc_prefix", "data_entities_prefix",
+        "wc_plot_filename", "barplot_filename", "n_top_words", "n_top_entities"
+    ]
+    if any(key not in conf for key in required_keys):
+        logger.error(
+            "Invalid configuration file. Please check template and retry")
+        sys.exit(0)
+    page_id = conf["page_id"]
+    if args.command == "enqueue":
+        enqueue(conf, args.queue, args.pages or [page_id])
+    elif args.command == "work":
+        if args.ner_mode in ["spacy", "prefilter"] and args.lang is None:
+            logger.error("Please provide --lang with --ner-mode {}".format(args.ner_mode))
+            sys.exit(1)
+        workers = [
+            multiprocessing.Process(
+                target=work,
+                args=(conf, args.queue, args.ner_mode, args.lang, args.processes))
+            for _ in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        reduce(conf, args.queue, args.output_dir or page_id)
+    logger.info("\a\a\aDIN DONE! in {} seconds".format(
+        round((time.time() - start), 1)))
+
+
+if __name__ == "__main__":
+    main()
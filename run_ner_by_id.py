@@ -6,9 +6,13 @@ import time
 
 import spacy
 
+from classes.CommentIndex import CommentIndex
+from classes.CooccurrenceNetwork import CooccurrenceNetwork
+from classes.Gazetteer import Gazetteer
 from utils import (
     get_logger, load_config, get_post_data, get_comments, save_barplot,
-    create_nonexistent_dir, data_to_tsv, get_entities, count_entities
+    create_nonexistent_dir, data_to_tsv, extract_entities, count_entities,
+    index_comments
 )
 
 
@@ -18,24 +22,50 @@ def main():
     parser.add_argument(
         '-c', '--conf', type=str, metavar='', required=True,
         help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-i', '--index', action='store_true',
+        help='Also add the fetched comments to the local full-text index')
+    parser.add_argument(
+        '-m', '--ner-mode', type=str, metavar='', default="spacy",
+        choices=["spacy", "gazetteer", "prefilter"],
+        help='Entity extraction mode: spacy, gazetteer, or prefilter '
+             '(gazetteer lookup first, spaCy only on comments with no hits)')
+    parser.add_argument(
+        '-o', '--cooccurrence', type=str, metavar='', default=None,
+        choices=["count", "pmi"],
+        help='Also save the top entity co-occurrence edges, '
+             'ranked by count or by pmi')
     args = parser.parse_args()
     config_path = args.conf
+    index_flag = args.index
+    ner_mode = args.ner_mode
+    edge_weight = args.cooccurrence
     start = time.time()
     logger = get_logger(__name__)
     logger.setLevel(logging.DEBUG)
     conf = load_config(config_path)
-    supported_languages = ["it", "en"]
-    lang = input("Insert language (it, en): ")
-    if lang not in supported_languages:
-        logger.error("Please provide a valid language. Supported: 'en', 'it'")
-        sys.exit(1)
-    else:
+    nlp = None
+    gazetteer = None
+    if ner_mode != "gazetteer":
+        supported_languages = ["it", "en"]
+        lang = input("Insert language (it, en): ")
+        if lang not in supported_languages:
+            logger.error("Please provide a valid language. Supported: 'en', 'it'")
+            sys.exit(1)
+        else:
+            try:
+                model = conf.get(lang)
+                nlp = spacy.load(model)
+            except OSError:
+                logger.error("Could not find model in conf file. Please double check")
+                sys.exit(0)
+    if ner_mode != "spacy":
         try:
-            model = conf.get(lang)
-            nlp = spacy.load(model)
-        except OSError:
-            logger.error("Could not find model in conf file. Please double check")
+            gazetteer = Gazetteer.from_json(conf["gazetteer_path"])
+        except (KeyError, IOError):
+            logger.error("Could not load gazetteer. Please check gazetteer_path in conf file")
             sys.exit(0)
+        logger.info("Loaded gazetteer with {} aliases".format(gazetteer.n_aliases))
     post_id = ""
     while post_id == "":
         post_id = input("Provide post ID: ")
@@ -43,7 +73,14 @@ def main():
         access_token = conf["access_token"]
         page_id = conf["page_id"]
         n_top_entities = conf["n_top_entities"]
+        if edge_weight is not None:
+            n_top_edges = conf["n_top_edges"]
+            min_edge_count = conf["min_edge_count"]
+            cooccurrence_filename = "{}_{}".format(
+                conf["data_cooccurrence_prefix"], str(post_id))
         data_dir_path = os.path.join(page_id, conf["data_dir_name"])
+        if index_flag:
+            index_filepath = os.path.join(data_dir_path, conf["index_filename"])
         data_filename = "{}_{}{}".format(conf["data_entities_prefix"], post_id, ".csv")
         plots_dir_path = os.path.join(page_id, conf["plots_dir_name"])
         barplot_filename = "{}_{}{}".format(conf["barplot_filename"], post_id, "_ner.png")
@@ -57,6 +94,12 @@ def main():
     logger.info("Getting data for post {}".format(url_post))
     local_start = time.time()
     data = get_post_data(access_token, actual_post_id)
+    if index_flag:
+        create_nonexistent_dir(data_dir_path)
+        index = CommentIndex(index_filepath)
+        n_indexed = index_comments(index, page_id, actual_post_id, data)
+        index.close()
+        logger.info("Indexed {} new comments in {}".format(n_indexed, index_filepath))
     comments = get_comments(data)
     if len(comments) == 0:
         logger.error(
@@ -75,9 +118,11 @@ def main():
             len(comments), round((time.time() - local_start), 2)))
     local_start = time.time()
     entities = []
+    comments_entities = []
     for comment in comments:
-        ents = get_entities(nlp, comment)
+        ents = extract_entities(comment, nlp, gazetteer)
         entities.extend(ents)
+        comments_entities.append(ents)
     logger.info("Extracted {} entities out of {} comments in {} seconds".format(
         len(entities), len(comments), round((time.time() - local_start), 2)))
     entities_data = count_entities(entities)
@@ -87,10 +132,25 @@ def main():
     data_to_tsv(entities_data, columns, data_filepath)
     logger.info("Saved {} unique entities and their counts in {} ".format(
         len(entities_data), data_filepath))
-    create_nonexistent_dir(plots_dir_path)
-    plot_labels = ["Entities", "Counts"]
-    save_barplot(entities_data, plot_labels, n_top_entities, barplot_filepath)
-    logger.info("Bar plot saved at {}".format(barplot_filepath))
+    if edge_weight is not None:
+        local_start = time.time()
+        network = CooccurrenceNetwork(comments_entities)
+        edges = network.edges(
+            n_top_edges, weight=edge_weight, min_count=min_edge_count)
+        cooccurrence_filepath = os.path.join(data_dir_path, cooccurrence_filename)
+        columns = ["source", "target", "count", "pmi"]
+        data_to_tsv(edges, columns, cooccurrence_filepath + ".tsv")
+        network.save_graphml(edges, cooccurrence_filepath + ".graphml")
+        logger.info("Saved top {} co-occurrence edges by {} in {}.tsv/.graphml in {} seconds".format(
+            len(edges), edge_weight, cooccurrence_filepath,
+            round((time.time() - local_start), 2)))
+    if entities_data:
+        create_nonexistent_dir(plots_dir_path)
+        plot_labels = ["Entities", "Counts"]
+        save_barplot(entities_data, plot_labels, n_top_entities, barplot_filepath)
+        logger.info("Bar plot saved at {}".format(barplot_filepath))
+    else:
+        logger.warning("Could not find any entities. No bar plot will be made")
     logger.info("\a\a\aDIN DONE! in {} seconds".format(
         round((time.time() - start), 1)))
 
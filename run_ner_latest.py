@@ -1,16 +1,26 @@
 import argparse
 import logging
+import math
 import os
 import sys
+import threading
 import time
+from collections import Counter
 
 import facebook
+import requests
 import spacy
 
+from classes.Checkpoint import Checkpoint
+from classes.CommentIndex import CommentIndex
+from classes.CooccurrenceNetwork import CooccurrenceNetwork
+from classes.Gazetteer import Gazetteer
+from classes.RequestScheduler import RequestScheduler, SchedulerStopped
+from classes.ReservoirSampler import ReservoirSampler
 from utils import (
     get_logger, load_config, get_post_data, get_comments, save_barplot,
-    create_nonexistent_dir, data_to_tsv, get_entities, count_entities,
-    check_n_posts
+    create_nonexistent_dir, data_to_tsv, extract_entities, count_entities,
+    check_n_posts, index_comments, bootstrap_top_counts
 )
 
 
@@ -20,36 +30,92 @@ def main():
     parser.add_argument(
         '-c', '--conf', type=str, metavar='', required=True,
         help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-i', '--index', action='store_true',
+        help='Also add the fetched comments to the local full-text index')
+    parser.add_argument(
+        '-r', '--resume', action='store_true',
+        help='Resume from the last checkpoint of an interrupted run')
+    parser.add_argument(
+        '-m', '--ner-mode', type=str, metavar='', default="spacy",
+        choices=["spacy", "gazetteer", "prefilter"],
+        help='Entity extraction mode: spacy, gazetteer, or prefilter '
+             '(gazetteer lookup first, spaCy only on comments with no hits)')
+    parser.add_argument(
+        '-o', '--cooccurrence', type=str, metavar='', default=None,
+        choices=["count", "pmi"],
+        help='Also save the top entity co-occurrence edges, '
+             'ranked by count or by pmi')
+    parser.add_argument(
+        '-s', '--sample', type=int, metavar='', default=None,
+        help='Estimate the counts from a random sample of about this many '
+             'comments, the same number from each post')
+    parser.add_argument(
+        '-t', '--time-budget', type=float, metavar='', default=None,
+        help='Stop fetching new posts after this many seconds. '
+             '--sample alone does not reduce the fetch time')
     args = parser.parse_args()
     config_path = args.conf
+    index_flag = args.index
+    resume = args.resume
+    ner_mode = args.ner_mode
+    edge_weight = args.cooccurrence
+    sample_size = args.sample
+    time_budget = args.time_budget
+    run_suffix = "" if sample_size is None else "_sample{}".format(sample_size)
+    # the entities of every single comment are only needed by these two
+    keep_comments = edge_weight is not None or sample_size is not None
     start = time.time()
     logger = get_logger(__name__)
     logger.setLevel(logging.DEBUG)
     conf = load_config(config_path)
-    supported_languages = ["it", "en"]
-    lang = input("Insert language (it, en): ")
-    if lang not in supported_languages:
-        logger.error("Please provide a valid language. Supported: 'en', 'it'")
-        sys.exit(1)
-    else:
+    nlp = None
+    gazetteer = None
+    if ner_mode != "gazetteer":
+        supported_languages = ["it", "en"]
+        lang = input("Insert language (it, en): ")
+        if lang not in supported_languages:
+            logger.error("Please provide a valid language. Supported: 'en', 'it'")
+            sys.exit(1)
+        else:
+            try:
+                model = conf.get(lang)
+                nlp = spacy.load(model)
+            except OSError:
+                logger.error("Could not find model in conf file. Please double check")
+                sys.exit(0)
+    if ner_mode != "spacy":
         try:
-            model = conf.get(lang)
-            nlp = spacy.load(model)
-        except OSError:
-            logger.error("Could not find model in conf file. Please double check")
+            gazetteer = Gazetteer.from_json(conf["gazetteer_path"])
+        except (KeyError, IOError):
+            logger.error("Could not load gazetteer. Please check gazetteer_path in conf file")
             sys.exit(0)
+        logger.info("Loaded gazetteer with {} aliases".format(gazetteer.n_aliases))
     n_posts = check_n_posts()
     if not n_posts.isdigit() and n_posts != "-1":
         logger.error("Please give a number. Exiting")
         sys.exit(0)
     try:
         access_token = conf["access_token"]
+        n_fetch_workers = conf.get("n_fetch_workers", 1)
         page_id = conf["page_id"]
         n_top_entities = conf["n_top_entities"]
+        if edge_weight is not None:
+            n_top_edges = conf["n_top_edges"]
+            min_edge_count = conf["min_edge_count"]
+            cooccurrence_filename = "{}_{}posts{}".format(
+                conf["data_cooccurrence_prefix"], str(n_posts), run_suffix)
         data_dir_path = os.path.join(page_id, conf["data_dir_name"])
-        data_filename = "{}_{}.tsv".format(conf["data_entities_prefix"], str(n_posts))
+        if index_flag:
+            index_filepath = os.path.join(data_dir_path, conf["index_filename"])
+        checkpoint_filepath = os.path.join(data_dir_path, "{}_{}posts{}_ner.json".format(
+            conf.get("checkpoint_prefix", "checkpoint"), str(n_posts), run_suffix))
+        checkpoint_every = conf.get("checkpoint_every", 5)
+        data_filename = "{}_{}{}.tsv".format(
+            conf["data_entities_prefix"], str(n_posts), run_suffix)
         plots_dir_path = os.path.join(page_id, conf["plots_dir_name"])
-        barplot_filename = "{}_{}posts_ner.png".format(conf["barplot_filename"], str(n_posts))
+        barplot_filename = "{}_{}posts{}_ner.png".format(
+            conf["barplot_filename"], str(n_posts), run_suffix)
         barplot_filepath = os.path.join(plots_dir_path, barplot_filename)
     except KeyError:
         logger.error(
@@ -62,60 +128,190 @@ def main():
     except facebook.GraphAPIError as e:
         logger.error("Could not log in. {}".format(e))
         sys.exit(0)
-    if n_posts != "":
-        logger.info("Getting the last {} posts".format(n_posts))
+    create_nonexistent_dir(data_dir_path)
+    checkpoint = Checkpoint(checkpoint_filepath, every=checkpoint_every)
+    state = checkpoint.load() if resume else None
+    if state is not None and state["ner_mode"] != ner_mode:
+        logger.error("Checkpoint {} was made with --ner-mode {}. Please use the same mode".format(
+            checkpoint_filepath, state["ner_mode"]))
+        sys.exit(0)
+    if state is not None and state["keep_comments"] != keep_comments:
+        logger.error("Checkpoint {} was made {} --cooccurrence. Please use the same options".format(
+            checkpoint_filepath, "with" if state["keep_comments"] else "without"))
+        sys.exit(0)
+    if state is not None:
+        logger.info("Resuming from checkpoint {}: {} of {} post(s) already processed".format(
+            checkpoint_filepath, len(state["processed_post_ids"]), len(state["post_ids"])))
     else:
-        logger.warning(
-            "Requesting posts with no limits. "
-            "This could be susceptible of limitations"
-            " in the near future due to high rate"
-        )
-    local_start = time.time()
-    posts = graph.get_connections(profile["id"], "posts", limit=n_posts)
-    comments = []
-    for post in posts["data"]:
-        url_post = "https://www.facebook.com/posts/{}".format(post["id"])
-        logger.info("Getting data for post {}".format(url_post))
-        post_data = get_post_data(access_token, post["id"])
-        post_comments = get_comments(post_data)
-        if len(post_comments) == 0:
+        if resume:
+            logger.warning("No checkpoint found at {}. Starting from scratch".format(
+                checkpoint_filepath))
+        if n_posts != "":
+            logger.info("Getting the last {} posts".format(n_posts))
+        else:
             logger.warning(
-                """Apparently, there are no comments at the selected post
-                Check the actual post on its Facebook page 
-                https://www.facebook.com/posts/{}""".format(post["id"])
+                "Requesting posts with no limits. "
+                "This could be susceptible of limitations"
+                " in the near future due to high rate"
             )
-        comments.extend(post_comments)
-    if len(comments) == 0:
+        posts = graph.get_connections(profile["id"], "posts", limit=n_posts)
+        state = {
+            "ner_mode": ner_mode,
+            "keep_comments": keep_comments,
+            "post_ids": [post["id"] for post in posts["data"]],
+            "processed_post_ids": [],
+            "cursors": {},
+            "n_comments": 0,
+            "n_processed_comments": 0,
+            "entities": {},
+            "comments_entities": [],
+            "strata": [],
+            "stratum_sizes": {}
+        }
+    local_start = time.time()
+    processed_post_ids = set(state["processed_post_ids"])
+    entities = Counter(state["entities"])
+    state["entities"] = entities
+    comments_entities = state["comments_entities"]
+    # the fetch threads checkpoint the paging cursors of the posts they
+    # are fetching, the lock keeps the state consistent while it is saved
+    state_lock = threading.Lock()
+
+    def save_cursor(post_id, next_url, page_data):
+        with state_lock:
+            # once the run is interrupted, the state is only saved by the main thread
+            if scheduler.stopped.is_set():
+                raise SchedulerStopped()
+            cursor = state["cursors"].setdefault(post_id, {"next": None, "data": []})
+            cursor["next"] = next_url
+            cursor["data"].extend(page_data)
+            if checkpoint.save(state):
+                logger.info("Checkpoint saved at {}".format(checkpoint_filepath))
+
+    if index_flag:
+        index = CommentIndex(index_filepath)
+    scheduler = RequestScheduler.from_conf(conf)
+    # posts are listed latest first, and fetched in this order
+    for priority, post_id in enumerate(state["post_ids"]):
+        if post_id not in processed_post_ids:
+            scheduler.submit(
+                priority, post_id, get_post_data, access_token, post_id,
+                raise_on_error=True, scheduler=scheduler,
+                cursor=state["cursors"].get(post_id),
+                on_page=lambda next_url, page_data, post_id=post_id: save_cursor(
+                    post_id, next_url, page_data))
+    try:
+        for post_id, post_data in scheduler.run(n_workers=n_fetch_workers):
+            url_post = "https://www.facebook.com/posts/{}".format(post_id)
+            logger.info("Got data for post {}".format(url_post))
+            post_comments = get_comments(post_data)
+            if index_flag:
+                n_indexed = index_comments(index, page_id, post_id, post_data)
+                logger.info("Indexed {} new comments in {}".format(n_indexed, index_filepath))
+            if len(post_comments) == 0:
+                logger.warning(
+                    """Apparently, there are no comments at the selected post
+                    Check the actual post on its Facebook page
+                    https://www.facebook.com/posts/{}""".format(post_id)
+                )
+            if sample_size is None:
+                post_sample = post_comments
+            else:
+                post_sampler = ReservoirSampler(
+                    int(math.ceil(sample_size / len(state["post_ids"]))))
+                post_sampler.extend(post_comments)
+                post_sample = post_sampler.sample
+            post_entities = [
+                extract_entities(comment, nlp, gazetteer) for comment in post_sample
+            ]
+            # the state is only updated once the whole post is processed
+            with state_lock:
+                for ents in post_entities:
+                    entities.update(ents)
+                if keep_comments:
+                    comments_entities.extend(post_entities)
+                if sample_size is not None:
+                    state["strata"].extend([post_id] * len(post_entities))
+                    state["stratum_sizes"][post_id] = len(post_comments)
+                state["n_comments"] += len(post_comments)
+                state["n_processed_comments"] += len(post_entities)
+                processed_post_ids.add(post_id)
+                state["processed_post_ids"].append(post_id)
+                state["cursors"].pop(post_id, None)
+                if checkpoint.save(state):
+                    logger.info("Checkpoint saved at {}".format(checkpoint_filepath))
+            if time_budget is not None and time.time() - local_start > time_budget:
+                logger.warning("Time budget of {} seconds exhausted after {} of {} post(s)".format(
+                    time_budget, len(processed_post_ids), len(state["post_ids"])))
+                scheduler.stop()
+                break
+    except (facebook.GraphAPIError, requests.RequestException, KeyboardInterrupt) as e:
+        # the posts being fetched stop at their next request, and do not
+        # keep the run waiting for them, nor hit the API, before it exits
+        scheduler.stop()
+        with state_lock:
+            checkpoint.save(state, force=True)
+        logger.error(
+            "Run interrupted after {} of {} post(s): {}. Checkpoint saved at {}. "
+            "Run again with --resume to continue".format(
+                len(processed_post_ids), len(state["post_ids"]), repr(e), checkpoint_filepath))
+        sys.exit(1)
+    finally:
+        if index_flag:
+            index.close()
+    n_comments = state["n_comments"]
+    if n_comments == 0:
         logger.error("Could not get any comments. Exiting gracefully")
+        checkpoint.clear()
         sys.exit(0)
-    elif len(comments) < 100:
+    elif n_comments < 100:
         logger.warning(
             "Found {} comment(s). Not enough data "
             "to make much sense. Plots will be made regardless".format(
-                len(comments)
+                n_comments
             )
         )
+    logger.info("Extracted {} entities out of {} comments from {} post(s) in {} seconds".format(
+        sum(entities.values()), state["n_processed_comments"], len(processed_post_ids),
+        round((time.time() - local_start), 1)))
+    if sample_size is None:
+        entities_data = count_entities(entities)
+        columns = ["entities", "count"]
+        ci = None
     else:
-        logger.info("Got {} comments from {} post(s) in {} seconds".format(
-            len(comments), len(posts["data"]), round((time.time() - local_start), 1)))
-    local_start = time.time()
-    entities = []
-    for comment in comments:
-        ents = get_entities(nlp, comment)
-        entities.extend(ents)
-    logger.info("Extracted {} entities out of {} comments in {} seconds".format(
-        len(entities), len(comments), round((time.time() - local_start), 2)))
-    entities_data = count_entities(entities)
+        logger.info("Sampled {} comments out of {}".format(
+            state["n_processed_comments"], n_comments))
+        entities_data = bootstrap_top_counts(
+            comments_entities, state["strata"], state["stratum_sizes"], n_top_entities)
+        columns = ["entities", "count", "ci_low", "ci_high"]
+        ci = [(low, high) for _, _, low, high in entities_data]
     create_nonexistent_dir(data_dir_path)
     data_filepath = os.path.join(data_dir_path, data_filename)
-    columns = ["entities", "count"]
     data_to_tsv(entities_data, columns, data_filepath)
     logger.info("Saved {} unique entities and their counts in {} ".format(
         len(entities_data), data_filepath))
-    create_nonexistent_dir(plots_dir_path)
-    plot_labels = ["Entities", "Counts"]
-    save_barplot(entities_data, plot_labels, n_top_entities, barplot_filepath, type_="entities")
-    logger.info("Bar plot saved at {}".format(barplot_filepath))
+    if edge_weight is not None:
+        local_start = time.time()
+        network = CooccurrenceNetwork(comments_entities)
+        edges = network.edges(
+            n_top_edges, weight=edge_weight, min_count=min_edge_count)
+        cooccurrence_filepath = os.path.join(data_dir_path, cooccurrence_filename)
+        columns = ["source", "target", "count", "pmi"]
+        data_to_tsv(edges, columns, cooccurrence_filepath + ".tsv")
+        network.save_graphml(edges, cooccurrence_filepath + ".graphml")
+        logger.info("Saved top {} co-occurrence edges by {} in {}.tsv/.graphml in {} seconds".format(
+            len(edges), edge_weight, cooccurrence_filepath,
+            round((time.time() - local_start), 2)))
+    if entities_data:
+        create_nonexistent_dir(plots_dir_path)
+        plot_labels = ["Entities", "Counts"]
+        save_barplot(
+            [row[:2] for row in entities_data], plot_labels, n_top_entities,
+            barplot_filepath, type_="entities", ci=ci)
+        logger.info("Bar plot saved at {}".format(barplot_filepath))
+    else:
+        logger.warning("Could not find any entities. No bar plot will be made")
+    checkpoint.clear()
     logger.info("\a\a\aDIN DONE! in {} seconds".format(
         round((time.time() - start), 1)))
 
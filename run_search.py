@@ -0,0 +1,68 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+from classes.CommentIndex import CommentIndex
+from utils import get_logger, load_config
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Search the locally indexed comments for a word or an entity""")
+    parser.add_argument(
+        '-c', '--conf', type=str, metavar='', required=True,
+        help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-q', '--query', type=str, metavar='', required=True,
+        help='Word, stemmed word or entity to look for')
+    parser.add_argument(
+        '-p', '--page', type=int, metavar='', default=1,
+        help='Page of results to show, starting from 1')
+    parser.add_argument(
+        '-n', '--page-size', type=int, metavar='', default=20,
+        help='Number of comments per page')
+    parser.add_argument(
+        '-r', '--raw', action='store_true',
+        help='Pass the query as an FTS5 expression, e.g. "salvini NOT lega"')
+    args = parser.parse_args()
+    config_path = args.conf
+    logger = get_logger(__name__)
+    logger.setLevel(logging.DEBUG)
+    conf = load_config(config_path)
+    try:
+        page_id = conf["page_id"]
+        data_dir_path = os.path.join(page_id, conf["data_dir_name"])
+        index_filepath = os.path.join(data_dir_path, conf["index_filename"])
+    except KeyError:
+        logger.error(
+            "Invalid configuration file. Please check template and retry")
+        sys.exit(0)
+    if not os.path.isfile(index_filepath):
+        logger.error(
+            "Could not find index {}. Run any of the run_* scripts "
+            "with --index first".format(index_filepath))
+        sys.exit(0)
+    local_start = time.time()
+    index = CommentIndex(index_filepath)
+    try:
+        n_matches = index.count(args.query, raw=args.raw)
+        results = index.search(
+            args.query, page=args.page, page_size=args.page_size, raw=args.raw)
+    except sqlite3.OperationalError as e:
+        logger.error("Invalid query {}. {}".format(args.query, e))
+        sys.exit(0)
+    finally:
+        index.close()
+    logger.info("Found {} comments matching {} in {} ms. Showing page {}".format(
+        n_matches, args.query, round((time.time() - local_start) * 1000, 1), args.page))
+    for result in results:
+        print("https://www.facebook.com/{}\t{}\t{}".format(
+            result["comment_id"], result["created_time"],
+            " ".join(result["message"].split())))
+
+
+if __name__ == "__main__":
+    main()
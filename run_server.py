@@ -0,0 +1,146 @@
+import argparse
+import json
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import matplotlib
+# plots are made by worker threads, with no display
+matplotlib.use("Agg")
+
+from classes.AnalysisService import AnalysisService
+from classes.ResultCache import ResultCache
+from utils import get_logger, load_config
+
+logger = get_logger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the analysis service:
+
+    POST /jobs                      queue a job, JSON body or query string,
+                                    see AnalysisService.parse_params
+    GET  /jobs/<job_id>             job status and, when done, counts as JSON
+    GET  /jobs/<job_id>/<plot>.png  barplot or wordcloud of a finished job
+    GET  /status                    loaded models, cache stats and jobs
+    """
+
+    def send_json(self, code, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_png(self, data):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+        params = dict(parse_qsl(url.query))
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length:
+                body = json.loads(self.rfile.read(length).decode("utf-8"))
+                if not isinstance(body, dict):
+                    raise ValueError("The request body must be a json object")
+                params.update(body)
+            job_id = self.server.service.submit(params)
+        except (TypeError, ValueError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(
+            202, {"job_id": job_id, "status": "queued"},
+            headers={"Location": "/jobs/{}".format(job_id)})
+
+    def do_GET(self):
+        parts = [part for part in urlsplit(self.path).path.split("/") if part]
+        service = self.server.service
+        if parts == ["status"]:
+            self.send_json(200, service.status())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = service.get_job(parts[1])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job {}".format(parts[1])})
+            else:
+                self.send_json(200, job)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2].endswith(".png"):
+            job = service.get_job(parts[1])
+            plot = service.get_plot(parts[1], parts[2][:-len(".png")])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job {}".format(parts[1])})
+            elif job["status"] in ["queued", "running"]:
+                self.send_json(409, {"error": "Job {} is {}".format(parts[1], job["status"])})
+            elif plot is None:
+                self.send_json(404, {"error": "No such plot for job {}".format(parts[1])})
+            else:
+                self.send_png(plot)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def log_message(self, format, *args):
+        logger.debug("{} - {}".format(self.address_string(), format % args))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Serve word counts and entities of posts and pages over HTTP""")
+    parser.add_argument(
+        '-c', '--conf', type=str, metavar='', required=True,
+        help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-p', '--port', type=int, metavar='', default=None,
+        help='Port to listen on, defaults to server_port in the conf file')
+    parser.add_argument(
+        '-l', '--lang', type=str, metavar='', nargs='+', default=[],
+        choices=["it", "en"],
+        help='spaCy models to load at startup, the others are loaded on first use')
+    parser.add_argument(
+        '-g', '--graph-url', type=str, metavar='', default=None,
+        help='Graph API root url, e.g. of a mock server for testing')
+    args = parser.parse_args()
+    conf = load_config(args.conf)
+    try:
+        host = conf["server_host"]
+        port = args.port or conf["server_port"]
+        graph_url = args.graph_url or conf["graph_url"]
+        cache = ResultCache(conf["cache_size"], conf["cache_ttl_seconds"])
+        service = AnalysisService(
+            conf, n_workers=conf["n_server_workers"], cache=cache,
+            max_jobs=conf["max_jobs"], graph_url=graph_url)
+        for lang in args.lang:
+            service.load_model(lang)
+    except KeyError:
+        logger.error(
+            "Invalid configuration file. Please check template and retry")
+        sys.exit(0)
+    except OSError:
+        logger.error("Could not find model in conf file. Please double check")
+        sys.exit(0)
+    server = ThreadingHTTPServer((host, port), AnalysisHandler)
+    server.service = service
+    logger.info("Serving on http://{}:{}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import facebook
+
+from classes.RequestScheduler import RequestScheduler
+from classes.TextPreprocessor import TextPreprocessor
+from classes.TopicModeler import TopicModeler, SUPPORTED_METHODS
+from utils import (
+    get_logger, load_config, get_post_data, get_comments, check_n_posts,
+    create_nonexistent_dir, data_to_tsv, iter_tsv_rows, iter_batches
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Extract topics from the comments of a given number of posts""")
+    parser.add_argument(
+        '-c', '--conf', type=str, metavar='', required=True,
+        help='Specify the path of the configuration file')
+    args = parser.parse_args()
+    config_path = args.conf
+    start = time.time()
+    logger = get_logger(__name__)
+    logger.setLevel(logging.DEBUG)
+    conf = load_config(config_path)
+    n_posts = check_n_posts()
+    if not n_posts.isdigit() and n_posts != "-1":
+        logger.error("Please give a number. Exiting")
+        sys.exit(0)
+    try:
+        access_token = conf["access_token"]
+        page_id = conf["page_id"]
+        n_topics = conf["n_topics"]
+        n_top_topic_words = conf["n_top_topic_words"]
+        topic_method = conf["topic_method"]
+        batch_size = conf["topic_batch_size"]
+        data_dir_path = os.path.join(page_id, conf["data_dir_name"])
+        corpus_filename = "{}_{}posts_corpus.tsv".format(
+            conf["data_topics_prefix"], str(n_posts))
+        terms_filename = "{}_{}posts_terms.tsv".format(
+            conf["data_topics_prefix"], str(n_posts))
+        weights_filename = "{}_{}posts_weights.tsv".format(
+            conf["data_topics_prefix"], str(n_posts))
+    except KeyError:
+        logger.error(
+            "Invalid configuration file. Please check template and retry")
+        sys.exit(0)
+    if topic_method not in SUPPORTED_METHODS:
+        logger.error("Please provide a valid topic method. Supported: {}".format(
+            SUPPORTED_METHODS))
+        sys.exit(1)
+    try:
+        graph = facebook.GraphAPI(access_token)
+        logger.info("Graph API connected")
+        profile = graph.get_object(page_id)
+    except facebook.GraphAPIError as e:
+        logger.error("Could not log in. {}".format(e))
+        sys.exit(0)
+    create_nonexistent_dir(data_dir_path)
+    corpus_filepath = os.path.join(data_dir_path, corpus_filename)
+    local_start = time.time()
+    posts = graph.get_connections(profile["id"], "posts", limit=n_posts)
+    scheduler = RequestScheduler.from_conf(conf)
+    n_comments = 0
+
+    def preprocessed_rows():
+        """
+        Fetch and preprocess the comments one post at a time, so that
+        only the comments of a single post are held in memory
+        """
+        nonlocal n_comments
+        for post in posts["data"]:
+            url_post = "https://www.facebook.com/posts/{}".format(post["id"])
+            logger.info("Getting data for post {}".format(url_post))
+            post_data = get_post_data(access_token, post["id"], scheduler=scheduler)
+            post_comments = get_comments(post_data)
+            if len(post_comments) == 0:
+                logger.warning(
+                    """Apparently, there are no comments at the selected post
+                    Check the actual post on its Facebook page
+                    https://www.facebook.com/posts/{}""".format(post["id"])
+                )
+            for comment in post_comments:
+                preprocessed = TextPreprocessor(comment).preprocess()
+                if preprocessed != "":
+                    n_comments += 1
+                    yield post["id"], preprocessed
+        logger.info("Got {} comments from {} post(s) in {} seconds".format(
+            n_comments, len(posts["data"]), round((time.time() - local_start), 1)))
+
+    data_to_tsv(preprocessed_rows(), ["post_id", "comment"], corpus_filepath)
+    logger.info("Saved preprocessed corpus in {}".format(corpus_filepath))
+
+    def corpus_batches():
+        return (
+            [row[1] for row in batch]
+            for batch in iter_batches(iter_tsv_rows(corpus_filepath), batch_size)
+        )
+
+    if n_comments == 0:
+        logger.error("Could not get any comments. Exiting gracefully")
+        sys.exit(0)
+    elif n_comments < 100:
+        logger.warning(
+            "Found {} comment(s). Not enough data "
+            "to make much sense. Topics will be extracted regardless".format(
+                n_comments
+            )
+        )
+    local_start = time.time()
+    modeler = TopicModeler(n_topics=n_topics, method=topic_method)
+    try:
+        modeler.fit(corpus_batches)
+    except ValueError as e:
+        logger.error("Could not extract topics. {}".format(e))
+        sys.exit(0)
+    logger.info("Extracted {} topics with {} out of {} comments in {} seconds".format(
+        n_topics, topic_method, n_comments, round((time.time() - local_start), 1)))
+    topics = modeler.top_terms(n_top_topic_words)
+    terms_data = [
+        (topic_idx, rank, term, weight)
+        for topic_idx, terms in enumerate(topics)
+        for rank, (term, weight) in enumerate(terms)
+    ]
+    for topic_idx, terms in enumerate(topics):
+        logger.info("Topic {}: {}".format(
+            topic_idx, " ".join(term for term, _ in terms)))
+    terms_filepath = os.path.join(data_dir_path, terms_filename)
+    data_to_tsv(terms_data, ["topic", "rank", "term", "weight"], terms_filepath)
+    logger.info("Saved top {} terms of {} topics in {}".format(
+        n_top_topic_words, n_topics, terms_filepath))
+    post_weights = {}
+    post_counts = {}
+    for batch in iter_batches(iter_tsv_rows(corpus_filepath), batch_size):
+        weights = modeler.transform([row[1] for row in batch])
+        for (post_id, _), row_weights in zip(batch, weights):
+            if post_id not in post_weights:
+                post_weights[post_id] = row_weights.copy()
+                post_counts[post_id] = 0
+            else:
+                post_weights[post_id] += row_weights
+            post_counts[post_id] += 1
+    weights_data = [
+        [post_id] + [round(float(w) / post_counts[post_id], 4) for w in weights]
+        for post_id, weights in post_weights.items()
+    ]
+    weights_filepath = os.path.join(data_dir_path, weights_filename)
+    columns = ["post_id"] + ["topic_{}".format(i) for i in range(n_topics)]
+    data_to_tsv(weights_data, columns, weights_filepath)
+    logger.info("Saved topic weights of {} post(s) in {}".format(
+        len(weights_data), weights_filepath))
+    logger.info("\a\a\aDIN DONE! in {} seconds".format(
+        round((time.time() - start), 1)))
+
+
+if __name__ == "__main__":
+    main()
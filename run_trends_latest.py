@@ -0,0 +1,145 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import facebook
+import spacy
+
+from classes.Gazetteer import Gazetteer
+from classes.RequestScheduler import RequestScheduler
+from classes.TextPreprocessor import TextPreprocessor
+from classes.TrendCounter import TrendCounter, BUCKET_SECONDS, parse_created_time
+from utils import (
+    get_logger, load_config, get_post_data, get_comment_records, check_n_posts,
+    create_nonexistent_dir, data_to_tsv, extract_entities, save_lineplot
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Count words or entities over time in a given number of posts""")
+    parser.add_argument(
+        '-c', '--conf', type=str, metavar='', required=True,
+        help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-b', '--bucket', type=str, metavar='', default="day",
+        choices=list(BUCKET_SECONDS),
+        help='Time bucket size: hour, day or week')
+    parser.add_argument(
+        '-w', '--window', type=int, metavar='', default=7,
+        help='Rolling window size, in buckets')
+    parser.add_argument(
+        '-m', '--ner-mode', type=str, metavar='', default=None,
+        choices=["spacy", "gazetteer", "prefilter"],
+        help='Count entities instead of words, extracted with spacy, '
+             'gazetteer, or prefilter (gazetteer lookup first, spaCy '
+             'only on comments with no hits)')
+    args = parser.parse_args()
+    config_path = args.conf
+    ner_mode = args.ner_mode
+    type_ = "words" if ner_mode is None else "entities"
+    start = time.time()
+    logger = get_logger(__name__)
+    logger.setLevel(logging.DEBUG)
+    conf = load_config(config_path)
+    nlp = None
+    gazetteer = None
+    if ner_mode in ["spacy", "prefilter"]:
+        supported_languages = ["it", "en"]
+        lang = input("Insert language (it, en): ")
+        if lang not in supported_languages:
+            logger.error("Please provide a valid language. Supported: 'en', 'it'")
+            sys.exit(1)
+        else:
+            try:
+                model = conf.get(lang)
+                nlp = spacy.load(model)
+            except OSError:
+                logger.error("Could not find model in conf file. Please double check")
+                sys.exit(0)
+    if ner_mode in ["gazetteer", "prefilter"]:
+        try:
+            gazetteer = Gazetteer.from_json(conf["gazetteer_path"])
+        except (KeyError, IOError):
+            logger.error("Could not load gazetteer. Please check gazetteer_path in conf file")
+            sys.exit(0)
+        logger.info("Loaded gazetteer with {} aliases".format(gazetteer.n_aliases))
+    n_posts = check_n_posts()
+    if not n_posts.isdigit() and n_posts != "-1":
+        logger.error("Please give a number. Exiting")
+        sys.exit(0)
+    try:
+        access_token = conf["access_token"]
+        page_id = conf["page_id"]
+        n_top = conf["n_top_words"] if ner_mode is None else conf["n_top_entities"]
+        n_trend_lines = conf["n_trend_lines"]
+        data_dir_path = os.path.join(page_id, conf["data_dir_name"])
+        data_filename = "{}_{}_{}_{}posts.tsv".format(
+            conf["data_trends_prefix"], type_, args.bucket, str(n_posts))
+        plots_dir_path = os.path.join(page_id, conf["plots_dir_name"])
+        lineplot_filename = "{}_{}_{}_{}posts.png".format(
+            conf["trends_plot_filename"], type_, args.bucket, str(n_posts))
+        lineplot_filepath = os.path.join(plots_dir_path, lineplot_filename)
+    except KeyError:
+        logger.error(
+            "Invalid configuration file. Please check template and retry")
+        sys.exit(0)
+    try:
+        graph = facebook.GraphAPI(access_token)
+        logger.info("Graph API connected")
+        profile = graph.get_object(page_id)
+    except facebook.GraphAPIError as e:
+        logger.error("Could not log in. {}".format(e))
+        sys.exit(0)
+    local_start = time.time()
+    posts = graph.get_connections(profile["id"], "posts", limit=n_posts)
+    scheduler = RequestScheduler.from_conf(conf)
+    trends = TrendCounter(bucket=args.bucket, window=args.window)
+    n_comments = 0
+    for post in posts["data"]:
+        url_post = "https://www.facebook.com/posts/{}".format(post["id"])
+        logger.info("Getting data for post {}".format(url_post))
+        post_data = get_post_data(access_token, post["id"], scheduler=scheduler)
+        records = get_comment_records(post_data, post["id"])
+        if len(records) == 0:
+            logger.warning(
+                """Apparently, there are no comments at the selected post
+                Check the actual post on its Facebook page
+                https://www.facebook.com/posts/{}""".format(post["id"])
+            )
+        for record in records:
+            if ner_mode is None:
+                terms = TextPreprocessor(record["message"]).preprocess().split()
+            else:
+                terms = extract_entities(record["message"], nlp, gazetteer)
+            trends.add(parse_created_time(record["created_time"]), terms)
+        n_comments += len(records)
+    if n_comments == 0:
+        logger.error("Could not get any comments. Exiting gracefully")
+        sys.exit(0)
+    logger.info("Counted {} in {} comments from {} post(s) in {} seconds".format(
+        type_, n_comments, len(posts["data"]), round((time.time() - local_start), 1)))
+    trend_data = trends.trend_table(n_top)
+    create_nonexistent_dir(data_dir_path)
+    data_filepath = os.path.join(data_dir_path, data_filename)
+    columns = [
+        "bucket_start", "word" if ner_mode is None else "entity",
+        "count", "window_count", "emerging_score"
+    ]
+    data_to_tsv(trend_data, columns, data_filepath)
+    logger.info("Saved rolling top {} and emerging {} per {} in {}".format(
+        n_top, type_, args.bucket, data_filepath))
+    top_terms = [term for term, _ in trends.total_counts()[:n_trend_lines]]
+    bucket_starts, series = trends.series(top_terms)
+    create_nonexistent_dir(plots_dir_path)
+    plot_labels = [args.bucket.capitalize(), "Counts"]
+    save_lineplot(bucket_starts, series, plot_labels, lineplot_filepath, type_=type_)
+    logger.info("Line plot saved at {}".format(lineplot_filepath))
+    logger.info("\a\a\aDIN DONE! in {} seconds".format(
+        round((time.time() - start), 1)))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,12 @@ import os
 import sys
 import time
 
+from classes.CommentIndex import CommentIndex
 from classes.TextPreprocessor import TextPreprocessor
 from classes.WordCloudPlotter import Plotter
 from utils import (
     get_logger, load_config, get_post_data, get_comments, do_wordcount,
-    create_nonexistent_dir, save_barplot, data_to_tsv
+    create_nonexistent_dir, save_barplot, data_to_tsv, index_comments
 )
 
 
@@ -18,8 +19,12 @@ def main():
     parser.add_argument(
         '-c', '--conf', type=str, metavar='', required=True,
         help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-i', '--index', action='store_true',
+        help='Also add the fetched comments to the local full-text index')
     args = parser.parse_args()
     config_path = args.conf
+    index_flag = args.index
     start = time.time()
     logger = get_logger(__name__)
     logger.setLevel(logging.DEBUG)
@@ -32,6 +37,8 @@ def main():
         page_id = conf["page_id"]
         n_top_words = conf["n_top_words"]
         data_dir_path = os.path.join(page_id, conf["data_dir_name"])
+        if index_flag:
+            index_filepath = os.path.join(data_dir_path, conf["index_filename"])
         data_filename = "{}_{}{}".format(conf["data_wc_prefix"], post_id, ".csv")
         plots_dir_path = os.path.join(page_id, conf["plots_dir_name"], "single_posts", post_id)
         wc_plot_filename = "{}_{}{}".format(conf["wc_plot_filename"], post_id, ".png")
@@ -47,6 +54,12 @@ def main():
     actual_post_id = page_id + "_" + post_id
     local_start = time.time()
     data = get_post_data(access_token, actual_post_id)
+    if index_flag:
+        create_nonexistent_dir(data_dir_path)
+        index = CommentIndex(index_filepath)
+        n_indexed = index_comments(index, page_id, actual_post_id, data)
+        index.close()
+        logger.info("Indexed {} new comments in {}".format(n_indexed, index_filepath))
     comments = get_comments(data)
     if len(comments) == 0:
         logger.error(
@@ -1,16 +1,21 @@
 import argparse
 import logging
+import math
 import os
 import sys
 import time
 
 import facebook
 
+from classes.CommentIndex import CommentIndex
+from classes.RequestScheduler import RequestScheduler
+from classes.ReservoirSampler import ReservoirSampler
 from classes.TextPreprocessor import TextPreprocessor
 from classes.WordCloudPlotter import Plotter
 from utils import (
     get_logger, load_config, get_post_data, get_comments, do_wordcount,
-    create_nonexistent_dir, data_to_tsv, save_barplot, check_n_posts
+    create_nonexistent_dir, data_to_tsv, save_barplot, check_n_posts, index_comments,
+    bootstrap_top_counts
 )
 
 
@@ -20,8 +25,26 @@ def main():
     parser.add_argument(
         '-c', '--conf', type=str, metavar='', required=True,
         help='Specify the path of the configuration file')
+    parser.add_argument(
+        '-i', '--index', action='store_true',
+        help='Also add the fetched comments to the local full-text index')
+    parser.add_argument(
+        '-s', '--sample', type=int, metavar='', default=None,
+        help='Estimate the counts from a random sample of this many comments')
+    parser.add_argument(
+        '--stratify', action='store_true',
+        help='Sample the same number of comments from each post')
+    parser.add_argument(
+        '-t', '--time-budget', type=float, metavar='', default=None,
+        help='Stop fetching new posts after this many seconds. '
+             '--sample alone does not reduce the fetch time')
     args = parser.parse_args()
     config_path = args.conf
+    index_flag = args.index
+    sample_size = args.sample
+    stratify = args.stratify
+    time_budget = args.time_budget
+    run_suffix = "" if sample_size is None else "_sample{}".format(sample_size)
     start = time.time()
     logger = get_logger(__name__)
     logger.setLevel(logging.DEBUG)
@@ -32,14 +55,19 @@ def main():
         sys.exit(0)
     try:
         access_token = conf["access_token"]
+        n_fetch_workers = conf.get("n_fetch_workers", 1)
         page_id = conf["page_id"]
         n_top_words = conf["n_top_words"]
         data_dir_path = os.path.join(page_id, conf["data_dir_name"])
-        data_filename = "{}_{}.tsv".format(conf["data_wc_prefix"], str(n_posts))
+        if index_flag:
+            index_filepath = os.path.join(data_dir_path, conf["index_filename"])
+        data_filename = "{}_{}{}.tsv".format(conf["data_wc_prefix"], str(n_posts), run_suffix)
         plots_dir_path = os.path.join(page_id, conf["plots_dir_name"])
-        wc_plot_filename = "{}_{}posts.png".format(conf["wc_plot_filename"], str(n_posts))
+        wc_plot_filename = "{}_{}posts{}.png".format(
+            conf["wc_plot_filename"], str(n_posts), run_suffix)
         wc_plot_filepath = os.path.join(plots_dir_path, wc_plot_filename)
-        barplot_filename = "{}_{}posts.png".format(conf["barplot_filename"], str(n_posts))
+        barplot_filename = "{}_{}posts{}.png".format(
+            conf["barplot_filename"], str(n_posts), run_suffix)
         barplot_filepath = os.path.join(plots_dir_path, barplot_filename)
     except KeyError:
         logger.error(
@@ -54,46 +82,98 @@ def main():
         sys.exit(0)
     local_start = time.time()
     posts = graph.get_connections(profile["id"], "posts", limit=n_posts)
+    if index_flag:
+        create_nonexistent_dir(data_dir_path)
+        index = CommentIndex(index_filepath)
+    scheduler = RequestScheduler.from_conf(conf)
+    # posts are listed latest first, and fetched in this order
+    for priority, post in enumerate(posts["data"]):
+        scheduler.submit(
+            priority, post["id"], get_post_data, access_token, post["id"],
+            scheduler=scheduler)
     comments = []
-    for post in posts["data"]:
-        url_post = "https://www.facebook.com/posts/{}".format(post["id"])
-        logger.info("Getting data for post {}".format(url_post))
-        post_data = get_post_data(access_token, post["id"])
+    strata = []
+    stratum_sizes = {}
+    n_fetched = 0
+    n_fetched_posts = 0
+    if sample_size is not None and not stratify:
+        reservoir = ReservoirSampler(sample_size)
+    for post_id, post_data in scheduler.run(n_workers=n_fetch_workers):
+        url_post = "https://www.facebook.com/posts/{}".format(post_id)
+        logger.info("Got data for post {}".format(url_post))
         post_comments = get_comments(post_data)
+        if index_flag:
+            n_indexed = index_comments(index, page_id, post_id, post_data)
+            logger.info("Indexed {} new comments in {}".format(n_indexed, index_filepath))
         if len(post_comments) == 0:
             logger.warning(
                 """Apparently, there are no comments at the selected post
                 Check the actual post on its Facebook page 
-                https://www.facebook.com/posts/{}""".format(post["id"])
+                https://www.facebook.com/posts/{}""".format(post_id)
             )
-        comments.extend(post_comments)
-    if len(comments) == 0:
+        n_fetched += len(post_comments)
+        n_fetched_posts += 1
+        if sample_size is None:
+            comments.extend(post_comments)
+        elif stratify:
+            post_sampler = ReservoirSampler(int(math.ceil(sample_size / len(posts["data"]))))
+            post_sampler.extend(post_comments)
+            comments.extend(post_sampler.sample)
+            strata.extend([post_id] * len(post_sampler.sample))
+            stratum_sizes[post_id] = len(post_comments)
+        else:
+            reservoir.extend(post_comments)
+        if time_budget is not None and time.time() - local_start > time_budget:
+            logger.warning("Time budget of {} seconds exhausted after {} of {} post(s)".format(
+                time_budget, n_fetched_posts, len(posts["data"])))
+            scheduler.stop()
+            break
+    if index_flag:
+        index.close()
+    if sample_size is not None and not stratify:
+        comments = reservoir.sample
+        strata = ["all"] * len(comments)
+        stratum_sizes = {"all": reservoir.n_seen}
+    if n_fetched == 0:
         logger.error("Could not get any comments. Exiting gracefully")
         sys.exit(0)
-    elif len(comments) < 100:
+    elif n_fetched < 100:
         logger.warning(
             "Found {} comment(s). Not enough data "
             "to make much sense. Plots will be made regardless".format(
-                len(comments)
+                n_fetched
             )
         )
     else:
         logger.info("Got {} comments from {} post(s) in {} seconds".format(
-            len(comments), len(posts["data"]), round((time.time() - local_start), 1)))
+            n_fetched, n_fetched_posts, round((time.time() - local_start), 1)))
+    if sample_size is not None:
+        logger.info("Sampled {} comments out of {}".format(len(comments), n_fetched))
     local_start = time.time()
     preprocessed_comments = [TextPreprocessor(comm).preprocess() for comm in comments]
     logger.info("Preprocessed {} comments out of {} in {} seconds".format(
         len(preprocessed_comments), len(comments), round((time.time() - local_start), 2)))
-    wordcount_data = do_wordcount(preprocessed_comments)
+    if sample_size is None:
+        wordcount_data = do_wordcount(preprocessed_comments)
+        columns = ["word", "count"]
+        ci = None
+    else:
+        local_start = time.time()
+        wordcount_data = bootstrap_top_counts(
+            [pc.split() for pc in preprocessed_comments], strata, stratum_sizes, n_top_words)
+        columns = ["word", "count", "ci_low", "ci_high"]
+        ci = [(low, high) for _, _, low, high in wordcount_data]
+        logger.info("Estimated top {} word counts with bootstrap confidence intervals in {} seconds".format(
+            n_top_words, round((time.time() - local_start), 2)))
     create_nonexistent_dir(data_dir_path)
     data_filepath = os.path.join(data_dir_path, data_filename)
-    columns = ["word", "count"]
     data_to_tsv(wordcount_data, columns, data_filepath)
     logger.info("Saved {} words and their counts in {} ".format(
         len(wordcount_data), data_filepath))
     create_nonexistent_dir(plots_dir_path)
     plot_labels = ["Words", "Counts"]
-    save_barplot(wordcount_data, plot_labels, n_top_words, barplot_filepath)
+    save_barplot(
+        [row[:2] for row in wordcount_data], plot_labels, n_top_words, barplot_filepath, ci=ci)
     logger.info("Bar plot saved at {}".format(barplot_filepath))
     unstemmed_comments = [TextPreprocessor(comm).base_preprocess() for comm in comments]
     long_string = " ".join(uc for uc in unstemmed_comments)
@@ -0,0 +1,20 @@
+#!/bin/bash
+function usage()
+{
+    echo ""
+    echo -e "\tInstructions"
+    echo ""
+    echo -e "\tsource search.sh <path/to/config-file> <query> [--page N] [--page-size N] [--raw]"
+    echo ""
+}
+
+CONFIG=$1
+QUERY=$2
+if [[ -z $CONFIG || -z $QUERY ]]; then
+    echo "ERROR :: Config file or query not specified"
+    echo "Please specify the config-file path to use and the query"
+    echo -e "\a"
+    usage
+else
+    python ./run_search.py --conf $CONFIG --query "$QUERY" "${@:3}"
+fi
\ No newline at end of file
@@ -0,0 +1,20 @@
+#!/bin/bash
+function usage()
+{
+    echo ""
+    echo -e "\tInstructions"
+    echo ""
+    echo -e "\tsource server.sh <path/to/config-file> [--port N] [--lang it en] [--graph-url URL]"
+    echo ""
+}
+
+CONFIG=$1
+if [[ -z $CONFIG ]]; then
+    echo "ERROR :: Config file not specified"
+    echo "Please specify the config-file path to use"
+    echo -e "\a"
+    usage
+else
+    echo "INFO :: Starting analysis server using config file:" $CONFIG
+    python ./run_server.py --conf $CONFIG "${@:2}"
+fi
@@ -0,0 +1,176 @@
+import json
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import matplotlib
+matplotlib.use("Agg")
+
+from classes.AnalysisService import AnalysisService
+from classes.ResultCache import ResultCache
+from classes.TextPreprocessor import TextPreprocessor
+
+PAGE_ID = "1000"
+POSTS = {
+    "1000_1": [
+        [{"id": "c1", "message": "Il governo ha approvato la legge"},
+         {"id": "c2", "message": "Governo ladro", "comments": {"data": [
+             {"id": "r1", "message": "La legge non passa"}]}}],
+        [{"id": "c3", "message": "Si vota domenica"}]
+    ],
+    "1000_2": [
+        [{"id": "c4", "message": "Domenica al mare"}]
+    ]
+}
+
+
+def expected_counts(post_ids):
+    counts = Counter()
+    for post_id in post_ids:
+        for page in POSTS[post_id]:
+            for comment in page:
+                thread = [comment] + comment.get("comments", {}).get("data", [])
+                for reply in thread:
+                    counts.update(TextPreprocessor(reply["message"]).preprocess().split())
+    return counts
+
+
+class MockGraphHandler(BaseHTTPRequestHandler):
+    """
+    Mock of the Graph API endpoints used by the service: the posts of
+    PAGE_ID, and the comments of the posts in POSTS, one page of
+    comments per request
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        nodes = [node for node in url.path.split("/") if node]
+        self.server.requests.append(url.path)
+        if nodes == [PAGE_ID, "posts"]:
+            data = {"data": [{"id": post_id} for post_id in sorted(POSTS)]}
+        elif len(nodes) == 2 and nodes[0] in POSTS and nodes[1] == "comments":
+            pages = POSTS[nodes[0]]
+            page = int(query.get("after", 0))
+            data = {"data": pages[page]}
+            if page + 1 < len(pages):
+                data["paging"] = {"next": "http://{}:{}/{}/comments?after={}".format(
+                    *self.server.server_address, nodes[0], page + 1)}
+        else:
+            data = {"error": {"message": "Unknown path {}".format(url.path), "code": 100}}
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAnalysisService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.graph = ThreadingHTTPServer(("127.0.0.1", 0), MockGraphHandler)
+        cls.graph.requests = []
+        threading.Thread(target=cls.graph.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.graph.shutdown()
+        cls.graph.server_close()
+
+    def setUp(self):
+        self.graph.requests.clear()
+        conf = {
+            "access_token": "token",
+            "page_id": PAGE_ID,
+            "page_tokens": {},
+            "extra_access_tokens": [],
+            "requests_per_second": 100,
+            "max_usage_percent": 80,
+            "n_top_words": 5,
+            "n_top_entities": 5,
+            "gazetteer_path": "gazetteer.json"
+        }
+        self.service = AnalysisService(
+            conf, n_workers=2, cache=ResultCache(16, 60),
+            graph_url="http://{}:{}/".format(*self.graph.server_address))
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def wait(self, job_id, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.service.get_job(job_id)
+            if job["status"] in ["done", "failed"]:
+                return job
+            time.sleep(0.05)
+        self.fail("Job {} did not finish in {} seconds".format(job_id, timeout))
+
+    def test_post_job(self):
+        job = self.wait(self.service.submit({"post_id": "1000_1"}))
+        self.assertEqual(job["status"], "done", job["error"])
+        self.assertEqual(job["result"]["posts"], 1)
+        self.assertEqual(job["result"]["comments"], 4)
+        counts = {row["word"]: row["count"] for row in job["result"]["counts"]}
+        expected = expected_counts(["1000_1"])
+        self.assertEqual(len(counts), 5)
+        for word, count in counts.items():
+            self.assertEqual(count, expected[word])
+        self.assertEqual(
+            sorted(counts.values()), sorted(count for _, count in expected.most_common(5)))
+        self.assertIn("barplot", job["plots"])
+        self.assertIn("wordcloud", job["plots"])
+        self.assertTrue(self.service.get_plot(job["job_id"], "barplot").startswith(b"\x89PNG"))
+        # both pages of comments were fetched
+        self.assertEqual(self.graph.requests, ["/1000_1/comments"] * 2)
+
+    def test_page_job(self):
+        job = self.wait(self.service.submit({"page_id": PAGE_ID, "n_posts": 2}))
+        self.assertEqual(job["status"], "done", job["error"])
+        self.assertEqual(job["result"]["posts"], 2)
+        self.assertEqual(job["result"]["comments"], 5)
+        counts = {row["word"]: row["count"] for row in job["result"]["counts"]}
+        expected = expected_counts(["1000_1", "1000_2"])
+        for word, count in counts.items():
+            self.assertEqual(count, expected[word])
+
+    def test_cache_hit(self):
+        self.wait(self.service.submit({"post_id": "1000_1"}))
+        n_requests = len(self.graph.requests)
+        job = self.wait(self.service.submit({"page_id": PAGE_ID, "n_posts": 2}))
+        self.assertEqual(job["status"], "done", job["error"])
+        # only the post list and the post that was not cached are fetched
+        self.assertEqual(
+            self.graph.requests[n_requests:], ["/1000/posts", "/1000_2/comments"])
+        self.assertEqual(self.service.cache.stats()["hits"], 1)
+        # other parameters are cached separately
+        job = self.wait(self.service.submit(
+            {"post_id": "1000_1", "analysis": "entities", "ner_mode": "gazetteer"}))
+        self.assertEqual(job["status"], "done", job["error"])
+        self.assertEqual(self.graph.requests[-1], "/1000_1/comments")
+
+    def test_graph_error(self):
+        job = self.wait(self.service.submit({"page_id": "2000"}))
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("Unknown path", job["error"])
+
+    def test_invalid_params(self):
+        for params in [
+            [], {}, {"post_id": "1000_1", "page_id": PAGE_ID},
+            {"post_id": 1}, {"post_id": "1000_1", "top": None},
+            {"post_id": "1000_1", "top": 0}, {"page_id": PAGE_ID, "n_posts": "all"},
+            {"post_id": "1000_1", "analysis": "entities"}
+        ]:
+            with self.assertRaises(ValueError):
+                self.service.submit(params)
+
+
+if __name__ == "__main__":
+    unittest.main()
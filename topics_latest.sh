@@ -0,0 +1,20 @@
+#!/bin/bash
+function usage()
+{
+    echo ""
+    echo -e "\tInstructions"
+    echo ""
+    echo -e "\tsource topics_latest.sh <path/to/config-file>"
+    echo ""
+}
+
+CONFIG=$1
+if [[ -z $CONFIG ]]; then
+    echo "ERROR :: Config file not specified"
+    echo "Please specify the config-file path to use"
+    echo -e "\a"
+    usage
+else
+    echo "INFO :: Running Topic Extraction using config file:" $CONFIG
+    python ./run_topics_latest.py --conf $CONFIG
+fi
\ No newline at end of file
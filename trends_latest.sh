@@ -0,0 +1,20 @@
+#!/bin/bash
+function usage()
+{
+    echo ""
+    echo -e "\tInstructions"
+    echo ""
+    echo -e "\tsource trends_latest.sh <path/to/config-file> [--bucket hour|day|week] [--window N] [--ner-mode spacy|gazetteer|prefilter]"
+    echo ""
+}
+
+CONFIG=$1
+if [[ -z $CONFIG ]]; then
+    echo "ERROR :: Config file not specified"
+    echo "Please specify the config-file path to use"
+    echo -e "\a"
+    usage
+else
+    echo "INFO :: Running Trend Count using config file:" $CONFIG
+    python ./run_trends_latest.py --conf $CONFIG "${@:2}"
+fi
\ No newline at end of file
@@ -5,10 +5,14 @@ import logging
 import os
 import sys
 from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
+import facebook
 import matplotlib.pyplot as plt
+import numpy as np
 import requests
 import seaborn as sns
+from scipy import sparse
 
 from classes.TextPreprocessor import TextPreprocessor
 
@@ -52,35 +56,105 @@ def load_config(path):
         sys.exit(0)
 
 
-def get_post_data(access_token, post_id):
+GRAPH_URL = "https://graph.facebook.com/"
+
+
+def set_access_token(url, access_token=None):
+    """
+    Return a Graph API url with its access token replaced,
+    or removed if access_token is None, e.g. before saving it
+
+    :param url: str
+    :param access_token: str, optional
+    :return: str
+    """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    params = [(k, v) for k, v in parse_qsl(query) if k != "access_token"]
+    if access_token is not None:
+        params.append(("access_token", access_token))
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+
+def get_post_data(access_token, post_id, raise_on_error=False, scheduler=None,
+                  base_url=GRAPH_URL, cursor=None, on_page=None):
     """
     Get the data for a given post_id, given
-    a valid access token
+    a valid access token. By default, paging stops silently at the
+    first error, e.g. when the rate limit is reached
 
     :param access_token: str
     :param post_id: str
+    :param raise_on_error: bool: raise facebook.GraphAPIError
+        instead of returning partial data
+    :param scheduler: classes.RequestScheduler.RequestScheduler, optional:
+        if given, requests are throttled by the scheduler, which
+        picks the access token to use
+    :param base_url: str, optional: Graph API root url
+    :param cursor: dict, optional: {"next": url, "data": list}, the
+        next page url and the data fetched so far, to resume paging
+        where an interrupted call left it
+    :param on_page: callable, optional: called with the next page url,
+        with no access token, and the new page data after every page
+        but the last, e.g. to checkpoint the cursor
     :return data: post data dict
     """
-    base_url = "https://graph.facebook.com/"
     comments_endpoint = (
-        "/comments?fields=message,comments{message,comments}&summary=1&access_token="
+        "/comments?fields=id,created_time,message,"
+        "comments{id,created_time,message,comments}&summary=1&access_token="
     )
     comments_url = (
             base_url + post_id +
             comments_endpoint +
             access_token
     )
-    comments_data = requests.get(comments_url).json()
-    data = []
+    if scheduler is not None:
+        get_json = scheduler.get
+    else:
+        def get_json(url):
+            return requests.get(url).json()
+    if cursor is not None:
+        data = list(cursor["data"])
+        comments_data = get_json(set_access_token(cursor["next"], access_token))
+    else:
+        data = []
+        comments_data = get_json(comments_url)
     while True:
+        if raise_on_error and "error" in comments_data:
+            raise facebook.GraphAPIError(comments_data)
         try:
             data.extend(comments_data["data"])
-            comments_data = requests.get(comments_data["paging"]["next"]).json()
+            next_url = comments_data["paging"]["next"]
         except KeyError:
             break
+        if on_page is not None:
+            on_page(set_access_token(next_url), comments_data["data"])
+        comments_data = get_json(next_url)
     return data
 
 
+def get_page_post_ids(access_token, page_id, n_posts, scheduler=None, base_url=GRAPH_URL):
+    """
+    Get the IDs of the latest posts of a given page, latest first
+
+    :param access_token: str
+    :param page_id: str
+    :param n_posts: int
+    :param scheduler: classes.RequestScheduler.RequestScheduler, optional:
+        if given, the request is throttled by the scheduler
+    :param base_url: str, optional: Graph API root url
+    :return: list of str
+    """
+    posts_url = "{}{}/posts?fields=id&limit={}&access_token={}".format(
+        base_url, page_id, n_posts, access_token)
+    if scheduler is not None:
+        posts_data = scheduler.get(posts_url)
+    else:
+        posts_data = requests.get(posts_url).json()
+    if "error" in posts_data:
+        raise facebook.GraphAPIError(posts_data)
+    return [post["id"] for post in posts_data["data"]]
+
+
 def get_comments(data):
     """
     Get all the comments for a given facebook post
@@ -101,6 +175,48 @@ def get_comments(data):
     return all_comments
 
 
+def get_comment_records(data, post_id):
+    """
+    Get all the comments for a given facebook post
+    data dict, along with their ID and creation time
+    :param data: dict
+    :param post_id: str
+    :return: list; list of dicts
+    """
+    all_records = []
+    for comment in data:
+        thread = [comment]
+        if "comments" in comment.keys():
+            thread.extend(comment["comments"]["data"])
+        for reply in thread:
+            if reply["message"] != "":
+                all_records.append({
+                    "post_id": post_id,
+                    "comment_id": reply.get("id"),
+                    "created_time": reply.get("created_time"),
+                    "message": reply["message"]
+                })
+    return all_records
+
+
+def index_comments(index, page_id, post_id, data):
+    """
+    Preprocess and add all the comments of a given facebook
+    post data dict to a CommentIndex
+
+    :param index: classes.CommentIndex.CommentIndex
+    :param page_id: str
+    :param post_id: str
+    :param data: dict
+    :return: int: number of new comments in the index
+    """
+    records = get_comment_records(data, post_id)
+    for record in records:
+        record["page_id"] = page_id
+        record["preprocessed"] = TextPreprocessor(record["message"]).preprocess()
+    return index.add_comments(records)
+
+
 def do_wordcount(comments):
     """
     Perfom word count on a given list of words
@@ -127,6 +243,39 @@ def data_to_tsv(data, columns, outfile_path):
         w.writerows(data)
 
 
+def iter_tsv_rows(path):
+    """
+    Lazily yield the rows of a TSV file written by data_to_tsv,
+    skipping the header
+
+    :param path: str: input file path
+    :return: generator of lists
+    """
+    with open(path, "r", encoding="utf-8") as tsv_file:
+        r = csv.reader(tsv_file, delimiter="\t")
+        next(r, None)
+        for row in r:
+            yield row
+
+
+def iter_batches(iterable, batch_size):
+    """
+    Yield lists of at most batch_size elements from a given iterable
+
+    :param iterable: iterable
+    :param batch_size: int
+    :return: generator of lists
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def create_nonexistent_dir(path, exc_raise=False):
     """
     Create a directory from a given path if it does not exist.
@@ -178,6 +327,24 @@ def get_entities(nlp, comment):
     return entities
 
 
+def extract_entities(comment, nlp=None, gazetteer=None):
+    """
+    Return list of entities in a given text, looking them up
+    in the gazetteer first and running spaCy only on the comments
+    with no gazetteer hits. Either of the two can be None
+    :param comment: str
+    :param nlp: spaCy model or None
+    :param gazetteer: classes.Gazetteer.Gazetteer or None
+    :return: list
+    """
+    entities = []
+    if gazetteer is not None:
+        entities = gazetteer.find_entities(comment)
+    if not entities and nlp is not None:
+        entities = get_entities(nlp, comment)
+    return entities
+
+
 def count_entities(entities):
     """
     Return entity cound
@@ -187,7 +354,61 @@ def count_entities(entities):
     return Counter(entities).most_common()
 
 
-def save_barplot(data, labels, n_max, path, type_="Words"):
+def bootstrap_top_counts(samples, strata, stratum_sizes, n_top,
+                         n_boot=200, alpha=0.05, seed=None):
+    """
+    Estimate the total counts of the top terms of a population of
+    comments from a stratified sample of it, with bootstrap confidence
+    intervals. Each sampled comment stands for stratum_size / sample_size
+    comments of its stratum, and the bootstrap resamples each stratum
+    independently. A plain random sample is a single stratum
+
+    :param samples: list of lists: the terms of each sampled comment
+    :param strata: list: the stratum, e.g. the post ID, of each sampled comment
+    :param stratum_sizes: dict: stratum -> number of comments in the population
+    :param n_top: int: number of top terms to return
+    :param n_boot: int: number of bootstrap replicates
+    :param alpha: float: 1 - confidence level of the intervals
+    :param seed: int, optional
+    :return: list of tuples(term, estimate, ci_low, ci_high)
+    """
+    vocabulary = {}
+    rows = []
+    cols = []
+    for i, terms in enumerate(samples):
+        for term in terms:
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            rows.append(i)
+    if not vocabulary:
+        return []
+    terms = list(vocabulary)
+    X = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(len(samples), len(terms)))
+    strata_idx = {}
+    for i, stratum in enumerate(strata):
+        strata_idx.setdefault(stratum, []).append(i)
+    weights = np.zeros(len(samples))
+    for stratum, idx in strata_idx.items():
+        weights[idx] = stratum_sizes[stratum] / len(idx)
+    estimates = X.T @ weights
+    top = np.argsort(-estimates, kind="stable")[:n_top]
+    X_top = X[:, top].toarray()
+    # how many times each sampled comment is drawn in each replicate
+    rng = np.random.default_rng(seed)
+    multiplicity = np.zeros((n_boot, len(samples)))
+    for idx in strata_idx.values():
+        multiplicity[:, idx] = rng.multinomial(
+            len(idx), np.full(len(idx), 1. / len(idx)), size=n_boot)
+    replicates = (multiplicity * weights) @ X_top
+    low, high = np.percentile(
+        replicates, [50 * alpha, 100 - 50 * alpha], axis=0)
+    return [
+        (terms[j], int(round(estimates[j])), int(round(l)), int(round(h)))
+        for j, l, h in zip(top, low, high)
+    ]
+
+
+def save_barplot(data, labels, n_max, path, type_="Words", ci=None):
     """
     Save bar plot of given data in format list(tuples)
 
@@ -196,6 +417,8 @@ def save_barplot(data, labels, n_max, path, type_="Words"):
     :param n_max: int: max number of elements
     :param path: str: output file path
     :param type_: str, optional
+    :param ci: list of tuples(low, high), optional: confidence intervals
+        of approximate counts, drawn as error bars
     :return: None
     """
     x, y = zip(*data)
@@ -205,12 +428,48 @@ def save_barplot(data, labels, n_max, path, type_="Words"):
         list(y)[:n_max],
         list(x)[:n_max],
         palette="Blues_d")
-    ax.set_title("Top {} {}".format(n_max, type_), fontsize=18)
+    if ci is None:
+        ax.set_title("Top {} {}".format(n_max, type_), fontsize=18)
+    else:
+        counts = np.array(y[:n_max], dtype=float)
+        low, high = np.array(ci[:n_max], dtype=float).T
+        ax.errorbar(
+            counts, np.arange(len(counts)),
+            xerr=[counts - low, high - counts], fmt="none", ecolor="black", capsize=4)
+        ax.set_title("Top {} {} (approximate, from a sample)".format(n_max, type_), fontsize=18)
     plt.xticks(fontsize=18)
     plt.xticks(fontsize=18)
     plt.xlabel(labels[1], fontsize=18)
     plt.ylabel(labels[0], fontsize=18, labelpad=20, rotation=90)
     plt.savefig(path)
+    plt.close()
+
+
+def save_lineplot(x, series, labels, path, type_="Words"):
+    """
+    Save line plot of given time series, one line per series
+
+    :param x: list: shared x values, e.g. bucket start datetimes
+    :param series: dict: series name -> list of y values
+    :param labels: list: x and y axis labels in this order
+    :param path: str: output file path
+    :param type_: str, optional
+    :return: None
+    """
+    sns.set(style="whitegrid")
+    plt.figure(figsize=(20, 10))
+    palette = sns.color_palette("husl", len(series))
+    for color, (name, y) in zip(palette, series.items()):
+        plt.plot(x, y, label=name, color=color, linewidth=2)
+    plt.title("Trend of top {} {}".format(len(series), type_), fontsize=18)
+    plt.xticks(fontsize=14, rotation=45)
+    plt.yticks(fontsize=14)
+    plt.xlabel(labels[0], fontsize=18)
+    plt.ylabel(labels[1], fontsize=18, labelpad=20, rotation=90)
+    plt.legend(fontsize=14)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
 
 
 def check_n_posts():
@@ -4,7 +4,7 @@ function usage()
     echo ""
     echo -e "\tInstructions"
     echo ""
-    echo -e "\tsource wc_by_id.sh <path/to/config-file>"
+    echo -e "\tsource wc_by_id.sh <path/to/config-file> [--index]"
     echo ""
 }
 
@@ -16,5 +16,5 @@ if [[ -z $CONFIG ]]; then
     usage
 else
     echo "INFO :: Running Word Count using config file:" $CONFIG
-    python ./run_wc_by_id.py --conf $CONFIG
+    python ./run_wc_by_id.py --conf $CONFIG "${@:2}"
 fi
\ No newline at end of file